@@ -9,7 +9,7 @@ from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "X-Rating-Count", "X-Rating-Average", "X-Rating-Histogram"])
 
 app.config['SECRET_KEY'] = os.environ.get('SERVER_SECRET', 'aaba450fa7f04e3b40ffc930e496251f')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///default.db')
@@ -22,11 +22,17 @@ db = SQLAlchemy(app)
 
 bcrypt = Bcrypt(app)
 
-migrate = Migrate(app, db)
+def include_object(object, name, type_, reflected, compare_to):
+    # Search indexes are managed by app.search, not by the model metadata.
+    return not (name or '').startswith('search_')
+
+migrate = Migrate(app, db, include_object=include_object)
 
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 ma = Marshmallow(app)
-database_initialized = False
 
-from app import models, schemas, utils, constants, routes
\ No newline at end of file
+from app import models, schemas, utils, constants, routes, commands
+
+from app.instrumentation import instrument_app
+instrument_app(app)
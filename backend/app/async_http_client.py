@@ -0,0 +1,188 @@
+import asyncio
+import atexit
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from app.metrics import registry
+from app.instrumentation import record_outbound_call
+from app.http_client import CircuitBreaker, CircuitOpenError, IDEMPOTENT_METHODS, payment_client
+from app.constants import PAYMENT_ASYNC, PAYMENT_ASYNC_CONCURRENCY, PAYMENT_POOL_SIZE, PAYMENT_CONNECT_TIMEOUT, PAYMENT_READ_TIMEOUT, PAYMENT_MAX_RETRIES, PAYMENT_RETRY_BACKOFF, PAYMENT_BREAKER_THRESHOLD, PAYMENT_BREAKER_RESET
+
+class AsyncRequestError(requests.RequestException):
+    pass
+
+class AsyncResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+def is_safe_to_retry(error, method, idempotent):
+    if idempotent or method in IDEMPOTENT_METHODS:
+        return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    # The connection was never established, so even a non-idempotent call can be repeated.
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+class AsyncHttpClient:
+    def __init__(self, name, pool_size, max_concurrency, connect_timeout, read_timeout, max_retries, retry_backoff, breaker_threshold, breaker_reset):
+        self.name = name
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        self.session = None
+        self.semaphore = None
+        self.in_flight = 0
+
+        self.requests_total = registry.counter(f'{name}_client_requests_total', f'Outbound {name} requests by outcome.', ('host', 'outcome'))
+        self.request_duration = registry.histogram(f'{name}_client_request_duration_seconds', f'Latency of outbound {name} requests by status.', ('host', 'method', 'status'))
+        registry.gauge(f'{name}_client_in_flight', f'Outbound {name} requests holding one of the {max_concurrency} concurrency slots.', lambda: self.in_flight)
+        registry.gauge(f'{name}_client_breaker_open', f'1 when the {name} circuit breaker rejects requests, 0.5 when half open.', self.breaker_states, ('host',))
+
+    def start(self):
+        if self.loop is not None:
+            return self.loop
+
+        with self.loop_lock:
+            if self.loop is None:
+                # A single event loop thread per process multiplexes the calls of every request thread over one connection pool.
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=f'{self.name}-client', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self.open_session(), loop).result()
+                self.loop = loop
+                atexit.register(self.close)
+
+        return self.loop
+
+    async def open_session(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size), timeout=self.timeout)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(timeout=5)
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start()).result()
+
+    def breaker(self, host):
+        with self.breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return self.breakers[host]
+
+    def is_available(self, url):
+        return not self.breaker(urlsplit(url).netloc).is_open()
+
+    async def request_async(self, method, url, idempotent=False, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+
+        if not breaker.allow_request():
+            self.requests_total.inc(host=host, outcome='rejected')
+            raise CircuitOpenError(f'Circuit breaker for {host} is open')
+
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                return await self.send(method, url, host, breaker, idempotent, kwargs)
+            finally:
+                self.in_flight -= 1
+
+    async def send(self, method, url, host, breaker, idempotent, kwargs):
+        attempt = 0
+        while True:
+            started_at = time.perf_counter()
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    result = AsyncResponse(response.status, response.headers, await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                self.observe_call(started_at, host, method, 'error')
+                if attempt < self.max_retries and is_safe_to_retry(error, method, idempotent):
+                    self.requests_total.inc(host=host, outcome='retried')
+                    attempt += 1
+                    await self.sleep_before_retry(attempt)
+                    continue
+
+                self.requests_total.inc(host=host, outcome='error')
+                breaker.record_failure()
+                raise AsyncRequestError(f'{method} {url} failed: {error!r}') from error
+
+            self.observe_call(started_at, host, method, result.status_code)
+            if result.status_code >= 500:
+                if attempt < self.max_retries and (idempotent or method in IDEMPOTENT_METHODS):
+                    self.requests_total.inc(host=host, outcome='retried')
+                    attempt += 1
+                    await self.sleep_before_retry(attempt)
+                    continue
+
+                self.requests_total.inc(host=host, outcome='server_error')
+                breaker.record_failure()
+                return result
+
+            self.requests_total.inc(host=host, outcome='ok')
+            breaker.record_success()
+            return result
+
+    def request(self, method, url, **kwargs):
+        # The loop thread has no request context, so the waiting thread reports the outbound time of its request.
+        started_at = time.perf_counter()
+        try:
+            return self.run(self.request_async(method, url, **kwargs))
+        finally:
+            record_outbound_call(time.perf_counter() - started_at)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def observe_call(self, started_at, host, method, status):
+        self.request_duration.observe(time.perf_counter() - started_at, host=host, method=method, status=status)
+
+    async def sleep_before_retry(self, attempt):
+        delay = self.retry_backoff * (2 ** (attempt - 1))
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    def breaker_states(self):
+        values = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 0.5, CircuitBreaker.OPEN: 1}
+        return {host: values[breaker.state] for host, breaker in list(self.breakers.items())}
+
+payment_async_client = AsyncHttpClient(
+    'payment_async',
+    pool_size=PAYMENT_POOL_SIZE,
+    max_concurrency=PAYMENT_ASYNC_CONCURRENCY,
+    connect_timeout=PAYMENT_CONNECT_TIMEOUT,
+    read_timeout=PAYMENT_READ_TIMEOUT,
+    max_retries=PAYMENT_MAX_RETRIES,
+    retry_backoff=PAYMENT_RETRY_BACKOFF,
+    breaker_threshold=PAYMENT_BREAKER_THRESHOLD,
+    breaker_reset=PAYMENT_BREAKER_RESET
+)
+
+# Both clients share the same interface, so request handlers only depend on which one is configured.
+payment_transport = payment_async_client if PAYMENT_ASYNC else payment_client
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import request, make_response
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import CacheVersion
+from app.constants import CACHE_URL, CACHE_TTL, CACHE_MAX_ENTRIES
+
+class LRUCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class RedisCache:
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_URL is set but the redis package is not installed')
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def get_versions(self, names):
+        return [int(version or 0) for version in self.client.mget([f'version:{name}' for name in names])]
+
+    def bump_versions(self, names):
+        pipeline = self.client.pipeline(transaction=False)
+        for name in names:
+            pipeline.incr(f'version:{name}')
+        pipeline.execute()
+
+class DatabaseVersions:
+    # Every process that writes books or borrows shares the database, including the payment reconciler and the
+    # CLI commands, so their invalidations reach the web workers without a shared cache server.
+    def get_versions(self, names):
+        with db.engine.connect() as connection:
+            versions = dict(connection.execute(select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))).all())
+        return [versions.get(name, 0) for name in names]
+
+    def bump_versions(self, names):
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            insert = sqlite.insert
+        elif dialect == 'postgresql':
+            insert = postgresql.insert
+        else:
+            raise RuntimeError(f'Cache versions are not supported on {dialect}, set CACHE_URL')
+
+        statement = insert(CacheVersion).on_conflict_do_update(index_elements=[CacheVersion.name], set_={'version': CacheVersion.version + 1})
+        # A separate connection, because versions are bumped from after_commit, when the session cannot run statements.
+        with db.engine.begin() as connection:
+            connection.execute(statement, [{'name': name, 'version': 1} for name in sorted(set(names))])
+
+def create_cache():
+    if CACHE_URL:
+        return RedisCache(CACHE_URL, CACHE_TTL)
+    return LRUCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+
+cache = create_cache()
+versions = cache if CACHE_URL else DatabaseVersions()
+
+def get_version(name):
+    return versions.get_versions([name])[0]
+
+def get_versions(names):
+    return versions.get_versions(names)
+
+def bump_versions(*names):
+    if names:
+        versions.bump_versions(names)
+
+def invalidate_books(*book_ids):
+    db.session.info.setdefault('invalidated_books', set()).update(book_ids)
+
+def invalidate_all_books():
+    bump_versions('catalog', 'books')
+
+def invalidate_user_borrows(*user_ids):
+    db.session.info.setdefault('invalidated_users', set()).update(user_ids)
+
+@event.listens_for(db.session, 'after_commit')
+def bump_invalidated_books(session):
+    book_ids = session.info.pop('invalidated_books', None)
+    if book_ids:
+        bump_versions('catalog', *[f'book:{book_id}' for book_id in book_ids])
+
+    user_ids = session.info.pop('invalidated_users', None)
+    if user_ids:
+        bump_versions(*[f'user:{user_id}:borrows' for user_id in user_ids])
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_invalidated_books(session):
+    session.info.pop('invalidated_books', None)
+    session.info.pop('invalidated_users', None)
+
+def normalized_query_string():
+    return urlencode(sorted((key, value) for key, values in request.args.lists() for value in values if value != ''))
+
+def cached_response(version_names, when=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if when is not None and not when():
+                return view(*args, **kwargs)
+
+            key_versions = '.'.join(str(version) for version in get_versions(version_names(**kwargs)))
+            key = f'response:{request.path}?{normalized_query_string()}@{key_versions}'
+
+            entry = cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+                body = response.get_data(as_text=True)
+                entry = {
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha1(body.encode()).hexdigest(),
+                    'headers': {name: value for name, value in response.headers.items() if name.startswith('X-')}
+                }
+                cache.set(key, entry)
+
+            response = make_response(entry['body'], 200, entry['headers'])
+            response.mimetype = entry['mimetype']
+            response.set_etag(entry['etag'])
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+import csv
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, db
+from app.models import Book
+from app.cache import invalidate_all_books
+
+class ImportReport:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.cached_covers = 0
+        self.fetched_covers = 0
+        self.failed_covers = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f'{self.read} rows in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s): '
+            f'{self.inserted} inserted, {self.updated} updated, {self.skipped} skipped; '
+            f'covers: {self.cached_covers} cached, {self.fetched_covers} fetched, {self.failed_covers} failed'
+        )
+
+def read_csv_rows(file):
+    yield from csv.DictReader(file)
+
+def read_jsonl_rows(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+CATALOG_READERS = {'csv': read_csv_rows, 'jsonl': read_jsonl_rows}
+
+def normalize_row(row):
+    isbn = ''.join(character for character in str(row.get('isbn') or '') if character.isalnum()).upper()
+    title = (row.get('title') or '').strip()
+    if not title or len(isbn) not in (10, 13):
+        return None
+
+    try:
+        total_copies = int(row.get('total_copies') or 1)
+        rental_price = float(row.get('rental_price') or 0)
+    except (TypeError, ValueError):
+        return None
+
+    if total_copies < 0 or rental_price < 0:
+        return None
+
+    return {
+        'title': title[:100],
+        'author': (row.get('author') or '').strip()[:100],
+        'isbn': isbn,
+        'total_copies': total_copies,
+        'rental_price': rental_price,
+        'cover_source': (row.get('cover_source') or '').strip()
+    }
+
+def upsert_statement(dialect):
+    if dialect == 'sqlite':
+        insert = sqlite.insert
+    elif dialect == 'postgresql':
+        insert = postgresql.insert
+    else:
+        raise RuntimeError(f'Catalog import does not support {dialect}')
+
+    statement = insert(Book)
+    excluded = statement.excluded
+    cover_source = func.coalesce(func.nullif(excluded.cover_source, ''), Book.cover_source)
+    return statement.on_conflict_do_update(index_elements=[Book.isbn], set_={
+        'title': excluded.title,
+        'author': excluded.author,
+        'rental_price': excluded.rental_price,
+        'total_copies': excluded.total_copies,
+        # Borrowed copies stay borrowed, only the difference in stock changes what is available.
+        'available_copies': Book.available_copies + excluded.total_copies - Book.total_copies,
+        'cover_source': cover_source,
+        # A stored thumbnail of a replaced cover is stale and gets fetched again.
+        'cover_hash': case((cover_source == Book.cover_source, Book.cover_hash), else_=None)
+    })
+
+def resolve_covers(rows, provider, cache, executor, report):
+    missing = {row['isbn'] for row in rows if not row['cover_source']}
+    if not missing or provider.name == 'none':
+        return
+
+    covers = cache.get_many(provider.name, missing) if cache else {}
+    report.cached_covers += len(covers)
+
+    to_fetch = sorted(missing.difference(covers))
+    fetched = {}
+    for isbn, cover_source in zip(to_fetch, executor.map(lookup_cover, itertools.repeat(provider), to_fetch)):
+        if cover_source is None:
+            report.failed_covers += 1
+        else:
+            fetched[isbn] = cover_source
+    report.fetched_covers += len(fetched)
+
+    if cache and fetched:
+        cache.put_many(provider.name, fetched)
+
+    covers.update(fetched)
+    for row in rows:
+        if not row['cover_source']:
+            row['cover_source'] = covers.get(row['isbn'], '')
+
+def lookup_cover(provider, isbn):
+    try:
+        return provider.lookup(isbn)
+    except (requests.RequestException, ValueError, KeyError):
+        # Not cached, so the next import asks again.
+        return None
+
+def import_batch(rows, statement, report):
+    existing = set(db.session.scalars(select(Book.isbn).where(Book.isbn.in_([row['isbn'] for row in rows]))))
+    db.session.execute(statement, [dict(row, available_copies=row['total_copies']) for row in rows])
+    db.session.commit()
+
+    report.updated += len(existing)
+    report.inserted += len(rows) - len(existing)
+
+def import_catalog(rows, provider, cache=None, batch_size=1000, workers=8, progress=None):
+    report = ImportReport()
+    statement = upsert_statement(db.engine.dialect.name)
+
+    rows = iter(rows)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            raw_rows = list(itertools.islice(rows, batch_size))
+            if not raw_rows:
+                break
+            report.read += len(raw_rows)
+
+            # One statement cannot update the same book twice, so the last row of an ISBN wins.
+            valid_rows = [row for row in map(normalize_row, raw_rows) if row is not None]
+            batch = list({row['isbn']: row for row in valid_rows}.values())
+            report.skipped += len(raw_rows) - len(batch)
+
+            if batch:
+                resolve_covers(batch, provider, cache, executor, report)
+                import_batch(batch, statement, report)
+
+            if progress:
+                progress(report)
+
+    invalidate_all_books()
+    app.logger.info('Imported catalog: %s', report.summary())
+    return report
@@ -0,0 +1,97 @@
+import click
+
+from app import app
+from app.constants import RECONCILE_INTERVAL, COVER_PROVIDER, COVER_LOOKUP_WORKERS, IMPORT_BATCH_SIZE, COVER_FETCH_WORKERS
+from app.reconciliation import reconcile_pending_payments, run_reconciliation_worker
+from app.search import get_search_provider
+from app.cache import invalidate_all_books
+from app.utils import rebuild_book_counters, backfill_review_timestamps
+from app.query_plans import check_query_plans
+from app.catalog_import import CATALOG_READERS, import_catalog
+from app.cover_metadata import COVER_PROVIDERS, create_cover_provider, open_cover_cache
+from app.cover_store import store_book_covers
+from app.recommendations import build_recommendations
+
+@app.cli.command('reconcile-payments')
+@click.option('--interval', default=RECONCILE_INTERVAL, show_default=True, help='Seconds between reconciliation runs.')
+@click.option('--once', is_flag=True, help='Run a single reconciliation pass and exit.')
+def reconcile_payments(interval, once):
+    """Poll the payment service for borrows whose payment is still pending."""
+    if once:
+        click.echo(f'Reconciled {reconcile_pending_payments()} payments')
+    else:
+        run_reconciliation_worker(interval)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create the book search index if needed and rebuild it from the book table."""
+    provider = get_search_provider()
+    provider.rebuild_index()
+    invalidate_all_books()
+    click.echo(f'Rebuilt the {provider.name} search index')
+
+@app.cli.command('rebuild-book-counters')
+@click.option('--missing-only', is_flag=True, help='Only fill books whose counters were never computed.')
+def rebuild_book_counters_command(missing_only):
+    """Recompute the per-book inventory and rating counters from borrows and reviews."""
+    click.echo(f'Rebuilt counters for {rebuild_book_counters(missing_only)} books')
+
+@app.cli.command('backfill-review-timestamps')
+def backfill_review_timestamps_command():
+    """Give reviews written before timestamps were recorded the time of the borrow they review."""
+    click.echo(f'Backfilled timestamps of {backfill_review_timestamps()} reviews')
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query, not only the failing ones.')
+def check_query_plans_command(verbose):
+    """EXPLAIN the hot queries and fail when one of them needs a full table scan."""
+    failures = 0
+    for name, details, full_scans in check_query_plans():
+        click.echo(f'{"FULL SCAN" if full_scans else "ok":<10}{name}')
+        if full_scans or verbose:
+            for detail in details:
+                click.echo(f'          {detail}')
+        failures += bool(full_scans)
+
+    if failures:
+        raise click.ClickException(f'{failures} queries need a full table scan')
+
+@app.cli.command('import-catalog')
+@click.argument('catalog', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'catalog_format', type=click.Choice(sorted(CATALOG_READERS)), help='Defaults to the file extension, or csv for standard input.')
+@click.option('--provider', type=click.Choice(sorted(COVER_PROVIDERS)), default=COVER_PROVIDER, show_default=True, help='Where covers of books without a cover_source are looked up.')
+@click.option('--workers', default=COVER_LOOKUP_WORKERS, show_default=True, help='Concurrent cover lookups.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='Books upserted per statement.')
+@click.option('--cache', 'cache_path', help='ISBN to cover cache file, by default in the instance folder.')
+def import_catalog_command(catalog, catalog_format, provider, workers, batch_size, cache_path):
+    """Insert or update books by ISBN from a CSV or JSON lines file with title, author, isbn, total_copies, rental_price and cover_source."""
+    if not catalog_format:
+        catalog_format = 'jsonl' if catalog.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    cache = open_cover_cache(cache_path)
+
+    def progress(report):
+        if report.read % (batch_size * 10) == 0:
+            click.echo(f'{report.read} rows, {report.rows_per_second:.0f} rows/s', err=True)
+
+    try:
+        report = import_catalog(CATALOG_READERS[catalog_format](catalog), create_cover_provider(provider), cache, batch_size, workers, progress)
+    finally:
+        cache.close()
+
+    click.echo(f'Imported {report.summary()}')
+
+@app.cli.command('store-covers')
+@click.option('--workers', default=COVER_FETCH_WORKERS, show_default=True, help='Concurrent cover downloads.')
+@click.option('--refresh', is_flag=True, help='Download covers that are already stored again.')
+def store_covers_command(workers, refresh):
+    """Download remote covers into the local cover store and serve their thumbnails from /covers."""
+    stored, failed = store_book_covers(refresh, workers)
+    click.echo(f'Stored {stored} covers, {failed} failed')
+
+@app.cli.command('build-recommendations')
+@click.option('--full', is_flag=True, help='Rebuild from every borrow instead of only the borrows since the last run.')
+def build_recommendations_command(full):
+    """Add new borrows to the co-borrow matrix and store the most related books of every changed book."""
+    borrows, books = build_recommendations(full)
+    click.echo(f'Processed {borrows} borrows, updated related books of {books} books')
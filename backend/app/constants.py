@@ -3,4 +3,48 @@ import os
 
 PUBLIC_HOSTNAME = os.environ.get('PUBLIC_HOSTNAME', 'backend:5000')
 PAYMENT_HOSTNAME = os.environ.get('PAYMENT_HOSTNAME', 'payment-mockup:5000')
-PAYMENT_SERVICE_SECRET = os.environ.get('PAYMENT_SERVICE_SECRET', '09acfc5f3afe754c536a82f3ad8bbfd4')
\ No newline at end of file
+PAYMENT_SERVICE_SECRET = os.environ.get('PAYMENT_SERVICE_SECRET', '09acfc5f3afe754c536a82f3ad8bbfd4')
+RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL', '30'))
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', '8'))
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '500'))
+RECONCILE_CHUNK_SIZE = int(os.environ.get('RECONCILE_CHUNK_SIZE', '200'))
+CATALOG_MAX_PAGE_SIZE = int(os.environ.get('CATALOG_MAX_PAGE_SIZE', '100'))
+CACHE_URL = os.environ.get('CACHE_URL')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+PAYMENT_POOL_SIZE = int(os.environ.get('PAYMENT_POOL_SIZE', '20'))
+PAYMENT_CONNECT_TIMEOUT = float(os.environ.get('PAYMENT_CONNECT_TIMEOUT', '3'))
+PAYMENT_READ_TIMEOUT = float(os.environ.get('PAYMENT_READ_TIMEOUT', '10'))
+PAYMENT_MAX_RETRIES = int(os.environ.get('PAYMENT_MAX_RETRIES', '2'))
+PAYMENT_RETRY_BACKOFF = float(os.environ.get('PAYMENT_RETRY_BACKOFF', '0.2'))
+PAYMENT_BREAKER_THRESHOLD = int(os.environ.get('PAYMENT_BREAKER_THRESHOLD', '5'))
+PAYMENT_BREAKER_RESET = float(os.environ.get('PAYMENT_BREAKER_RESET', '30'))
+PAYMENT_ASYNC = os.environ.get('PAYMENT_ASYNC', '0') == '1'
+PAYMENT_ASYNC_CONCURRENCY = int(os.environ.get('PAYMENT_ASYNC_CONCURRENCY', '50'))
+CHECKOUT_MAX_BOOKS = int(os.environ.get('CHECKOUT_MAX_BOOKS', '10'))
+BORROW_SUMMARY_TTL = int(os.environ.get('BORROW_SUMMARY_TTL', '30'))
+BORROWS_MAX_PAGE_SIZE = int(os.environ.get('BORROWS_MAX_PAGE_SIZE', '50'))
+REVIEWS_MAX_PAGE_SIZE = int(os.environ.get('REVIEWS_MAX_PAGE_SIZE', '50'))
+BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+PASSWORD_MAX_CONCURRENT_CHECKS = int(os.environ.get('PASSWORD_MAX_CONCURRENT_CHECKS', '2'))
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', '0.5'))
+SLOW_REQUEST_STATEMENTS = int(os.environ.get('SLOW_REQUEST_STATEMENTS', '5'))
+COVER_PROVIDER = os.environ.get('COVER_PROVIDER', 'google')
+COVER_LOOKUP_WORKERS = int(os.environ.get('COVER_LOOKUP_WORKERS', '8'))
+COVER_LOOKUP_TIMEOUT = float(os.environ.get('COVER_LOOKUP_TIMEOUT', '5'))
+COVER_CACHE_PATH = os.environ.get('COVER_CACHE_PATH')
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+COVER_STORE_PATH = os.environ.get('COVER_STORE_PATH')
+COVER_BASE_URL = os.environ.get('COVER_BASE_URL', 'http://localhost:5000/covers')
+COVER_THUMBNAIL_SIZE = os.environ.get('COVER_THUMBNAIL_SIZE', '200x300')
+COVER_FETCH_WORKERS = int(os.environ.get('COVER_FETCH_WORKERS', '8'))
+COVER_FETCH_TIMEOUT = float(os.environ.get('COVER_FETCH_TIMEOUT', '10'))
+COVER_MAX_BYTES = int(os.environ.get('COVER_MAX_BYTES', str(5 * 1024 * 1024)))
+COVER_MAX_AGE = int(os.environ.get('COVER_MAX_AGE', str(365 * 24 * 3600)))
+RECOMMENDATIONS_STATE_PATH = os.environ.get('RECOMMENDATIONS_STATE_PATH')
+RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', '20'))
+RECOMMENDATIONS_MIN_CO_BORROWS = int(os.environ.get('RECOMMENDATIONS_MIN_CO_BORROWS', '1'))
+SUGGEST_LIMIT = int(os.environ.get('SUGGEST_LIMIT', '10'))
+SUGGEST_REFRESH_INTERVAL = int(os.environ.get('SUGGEST_REFRESH_INTERVAL', '300'))
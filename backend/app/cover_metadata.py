@@ -0,0 +1,81 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import app
+from app.constants import COVER_CACHE_PATH, COVER_LOOKUP_TIMEOUT, COVER_LOOKUP_WORKERS
+
+class CoverProvider:
+    name = 'none'
+
+    def lookup(self, isbn):
+        return ''
+
+class StubCoverProvider(CoverProvider):
+    name = 'stub'
+
+    # Offline and deterministic, for tests and benchmarks of the import itself.
+    def lookup(self, isbn):
+        return f'https://covers.invalid/isbn/{isbn}.jpg'
+
+class GoogleBooksCoverProvider(CoverProvider):
+    name = 'google'
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=COVER_LOOKUP_WORKERS))
+
+    def lookup(self, isbn):
+        response = self.session.get('https://www.googleapis.com/books/v1/volumes', params={'q': f'isbn:{isbn}'}, timeout=COVER_LOOKUP_TIMEOUT)
+        response.raise_for_status()
+
+        items = response.json().get('items')
+        if not items:
+            return ''
+        return items[0]['volumeInfo'].get('imageLinks', {}).get('thumbnail', '')
+
+COVER_PROVIDERS = {provider.name: provider for provider in (CoverProvider, StubCoverProvider, GoogleBooksCoverProvider)}
+
+def create_cover_provider(name):
+    if name not in COVER_PROVIDERS:
+        raise ValueError(f'Unknown cover provider {name}')
+    return COVER_PROVIDERS[name]()
+
+class CoverCache:
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS cover (provider TEXT, isbn TEXT, cover_source TEXT, fetched_at TEXT, PRIMARY KEY (provider, isbn))')
+
+    def get_many(self, provider, isbns):
+        covers = {}
+        isbns = list(isbns)
+        # Stay below SQLite's limit on bound parameters.
+        for index in range(0, len(isbns), 500):
+            chunk = isbns[index:index + 500]
+            rows = self.connection.execute(
+                f'SELECT isbn, cover_source FROM cover WHERE provider = ? AND isbn IN ({", ".join("?" * len(chunk))})',
+                [provider, *chunk]
+            )
+            covers.update(rows)
+        return covers
+
+    def put_many(self, provider, covers):
+        fetched_at = datetime.utcnow().isoformat()
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO cover (provider, isbn, cover_source, fetched_at) VALUES (?, ?, ?, ?)',
+            [(provider, isbn, cover_source, fetched_at) for isbn, cover_source in covers.items()]
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def open_cover_cache(path=None):
+    path = path or COVER_CACHE_PATH
+    if not path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'cover_cache.sqlite3')
+    return CoverCache(path)
@@ -0,0 +1,126 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
+from sqlalchemy import select
+
+from app import app, db
+from app.models import Book
+from app.cache import invalidate_books
+from app.constants import COVER_STORE_PATH, COVER_THUMBNAIL_SIZE, COVER_FETCH_WORKERS, COVER_FETCH_TIMEOUT, COVER_MAX_BYTES, COVER_BASE_URL
+
+COVER_HASH_PATTERN = re.compile('[0-9a-f]{64}')
+
+class CoverFetchError(Exception):
+    pass
+
+class CoverStore:
+    def __init__(self, root, size):
+        self.root = root
+        self.size = size
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=COVER_FETCH_WORKERS))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=COVER_FETCH_WORKERS))
+
+    def path(self, cover_hash):
+        return os.path.join(self.root, cover_hash[:2], f'{cover_hash}.jpg')
+
+    def fetch(self, url):
+        try:
+            with self.session.get(url, timeout=COVER_FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                content = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    content += chunk
+                    if len(content) > COVER_MAX_BYTES:
+                        raise CoverFetchError(f'larger than {COVER_MAX_BYTES} bytes')
+        except requests.RequestException as error:
+            raise CoverFetchError(repr(error)) from error
+
+        return self.put(bytes(content))
+
+    def put(self, content):
+        thumbnail = self.thumbnail(content)
+        cover_hash = hashlib.sha256(thumbnail).hexdigest()
+
+        # The name is derived from the content, so an existing file never needs to be rewritten.
+        path = self.path(cover_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(thumbnail)
+            os.replace(temporary_path, path)
+
+        return cover_hash
+
+    def thumbnail(self, content):
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                # Lets the JPEG decoder skip most of the pixels of large originals.
+                image.draft('RGB', self.size)
+                image = ImageOps.exif_transpose(image).convert('RGB')
+                image = ImageOps.pad(image, self.size, Image.LANCZOS, color='white')
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            raise CoverFetchError(f'not a usable image: {error!r}') from error
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+        return output.getvalue()
+
+def create_cover_store():
+    root = COVER_STORE_PATH or os.path.join(app.instance_path, 'covers')
+    width, height = COVER_THUMBNAIL_SIZE.lower().split('x')
+    return CoverStore(root, (int(width), int(height)))
+
+cover_store = create_cover_store()
+
+def cover_url(book):
+    if not book.cover_hash:
+        return book.cover_source
+    return f'{COVER_BASE_URL}/{book.cover_hash}'
+
+def store_book_covers(refresh=False, workers=COVER_FETCH_WORKERS, batch_size=200):
+    stored, failed = 0, 0
+    last_id = 0
+    query = select(Book.id, Book.cover_source).where(Book.cover_source.like('http%'))
+    if not refresh:
+        query = query.where(Book.cover_hash.is_(None))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            books = db.session.execute(query.where(Book.id > last_id).order_by(Book.id).limit(batch_size)).all()
+            if not books:
+                break
+            last_id = books[-1].id
+
+            urls = list({book.cover_source for book in books})
+            fetched = dict(zip(urls, executor.map(fetch_cover, urls)))
+
+            cover_hashes = {}
+            for book in books:
+                if fetched[book.cover_source] is None:
+                    failed += 1
+                else:
+                    cover_hashes[book.id] = fetched[book.cover_source]
+
+            if cover_hashes:
+                db.session.execute(db.update(Book), [{'id': book_id, 'cover_hash': cover_hash} for book_id, cover_hash in cover_hashes.items()])
+                invalidate_books(*cover_hashes)
+                db.session.commit()
+                stored += len(cover_hashes)
+
+    return stored, failed
+
+def fetch_cover(url):
+    try:
+        return cover_store.fetch(url)
+    except CoverFetchError as error:
+        app.logger.warning('Could not store cover %s: %s', url, error)
+        return None
@@ -0,0 +1,95 @@
+import time
+from contextvars import ContextVar
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import registry
+from app.constants import SLOW_REQUEST_THRESHOLD, SLOW_REQUEST_STATEMENTS
+
+SQL_STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+request_duration = registry.histogram('http_request_duration_seconds', 'Request latency by endpoint.', ('method', 'endpoint', 'status'))
+request_sql_statements = registry.histogram('http_request_sql_statements', 'SQL statements executed per request.', ('endpoint',), SQL_STATEMENT_BUCKETS)
+request_sql_duration = registry.histogram('http_request_sql_duration_seconds', 'Time spent executing SQL per request.', ('endpoint',))
+request_outbound_duration = registry.histogram('http_request_outbound_duration_seconds', 'Time spent in outbound HTTP calls per request.', ('endpoint',))
+slow_requests_total = registry.counter('http_slow_requests_total', f'Requests slower than {SLOW_REQUEST_THRESHOLD}s.', ('endpoint',))
+
+current_stats = ContextVar('request_stats', default=None)
+
+class RequestStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = {}
+        self.outbound_count = 0
+        self.outbound_time = 0.0
+
+    def record_statement(self, statement, elapsed):
+        self.sql_count += 1
+        self.sql_time += elapsed
+        count, total = self.statements.get(statement, (0, 0.0))
+        self.statements[statement] = (count + 1, total + elapsed)
+
+    def record_outbound_call(self, elapsed):
+        self.outbound_count += 1
+        self.outbound_time += elapsed
+
+    def slowest_statements(self, limit):
+        return sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+
+def record_outbound_call(elapsed):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.record_outbound_call(elapsed)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is not None and context is not None:
+        context.request_stats = stats
+        context.statement_started_at = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    stats = getattr(context, 'request_stats', None)
+    if stats is not None:
+        stats.record_statement(' '.join(statement.split()), time.perf_counter() - context.statement_started_at)
+        context.request_stats = None
+
+def format_slow_request(stats, elapsed):
+    lines = [
+        f'Slow request {request.method} {request.full_path.rstrip("?")} took {elapsed * 1000:.1f}ms: '
+        f'{stats.sql_count} SQL statements in {stats.sql_time * 1000:.1f}ms, '
+        f'{stats.outbound_count} outbound calls in {stats.outbound_time * 1000:.1f}ms'
+    ]
+    for statement, (count, total) in stats.slowest_statements(SLOW_REQUEST_STATEMENTS):
+        lines.append(f'  {count:>4} x {total * 1000:>8.1f}ms  {statement[:300]}')
+    return '\n'.join(lines)
+
+def instrument_app(app):
+    @app.before_request
+    def start_request_stats():
+        current_stats.set(RequestStats())
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = current_stats.get()
+        if stats is None:
+            return response
+        current_stats.set(None)
+
+        elapsed = time.perf_counter() - stats.started_at
+        endpoint = request.endpoint or 'unmatched'
+        request_duration.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+        request_sql_statements.observe(stats.sql_count, endpoint=endpoint)
+        request_sql_duration.observe(stats.sql_time, endpoint=endpoint)
+        request_outbound_duration.observe(stats.outbound_time, endpoint=endpoint)
+
+        if elapsed >= SLOW_REQUEST_THRESHOLD:
+            slow_requests_total.inc(endpoint=endpoint)
+            app.logger.warning(format_slow_request(stats, elapsed))
+
+        return response
@@ -13,19 +13,52 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f'<User {self.username}>'
 
+def default_available_copies(context):
+    return context.get_current_parameters().get('total_copies', 1)
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100))
     author = db.Column(db.String(100))
     isbn = db.Column(db.String(13), unique=True)
     total_copies = db.Column(db.Integer, default=1)  
+    available_copies = db.Column(db.Integer, default=default_available_copies)
     rental_price = db.Column(db.Float, default=0.0)  
     borrows = db.relationship('Borrow', backref='book', lazy='dynamic')
     cover_source = db.Column(db.Text, default='')
+    cover_hash = db.Column(db.String(64))
+    rating_sum = db.Column(db.Integer, default=0)
+    rating_count = db.Column(db.Integer, default=0)
+    average_rating = db.Column(db.Float, default=0.0)
+    rating_1_count = db.Column(db.Integer, default=0)
+    rating_2_count = db.Column(db.Integer, default=0)
+    rating_3_count = db.Column(db.Integer, default=0)
+    rating_4_count = db.Column(db.Integer, default=0)
+    rating_5_count = db.Column(db.Integer, default=0)
 
     def __repr__(self):
         return f'<Book {self.title}>'
 
+class CacheVersion(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name} {self.version}>'
+
+class BookRelation(db.Model):
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    related_book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    co_borrows = db.Column(db.Integer)
+    score = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<BookRelation {self.book_id} {self.related_book_id}>'
+
+    __table_args__ = (
+        db.Index('ix_book_relation_book_score', 'book_id', 'score'),
+    )
+
 class Borrow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -34,16 +67,26 @@ class Borrow(db.Model):
     return_date = db.Column(db.DateTime)
     returned = db.Column(db.Boolean, default=False)
     payment_status = db.Column(db.String(50), default='pending')
-    payment_id = db.Column(db.String)
+    payment_id = db.Column(db.String, index=True)
     payment_url = db.Column(db.String)
     return_by_date = db.Column(db.DateTime)
+    payment_checked_at = db.Column(db.DateTime)
 
     def __repr__(self):
         return f'<Borrow {self.id} {self.user_id}>'
+
+    __table_args__ = (
+        db.Index('ix_borrow_user_book_returned', 'user_id', 'book_id', 'returned'),
+        db.Index('ix_borrow_user_borrow_date', 'user_id', 'borrow_date'),
+        # Only borrows that are still out can be overdue, so the overdue check only needs those rows.
+        db.Index('ix_borrow_user_due_active', 'user_id', 'return_by_date', postgresql_where=db.text('NOT returned'), sqlite_where=db.text('returned = 0')),
+        db.Index('ix_borrow_status_checked', 'payment_status', 'payment_checked_at')
+    )
     
 class Invoice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    borrow_id = db.Column(db.Integer, db.ForeignKey('borrow.id'))
+    borrow_id = db.Column(db.Integer, db.ForeignKey('borrow.id'), index=True)
+    payment_id = db.Column(db.String, unique=True)
     payment_date = db.Column(db.DateTime)
     
     def __repr__(self):
@@ -62,5 +105,6 @@ class Review(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('book_id', 'user_id', name='unique_review'),
+        db.Index('ix_review_book_timestamp', 'book_id', 'timestamp'),
         CheckConstraint('rating >= 1 AND rating <= 5', name='rating_range')
     )
\ No newline at end of file
@@ -0,0 +1,89 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import bcrypt
+
+from app.constants import BCRYPT_LOG_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_TIMEOUT, PASSWORD_MAX_CONCURRENT_CHECKS
+
+# bcrypt only looks at the first 72 bytes; older bcrypt releases truncated silently and newer ones refuse longer input.
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+# The pool did not answer in time or lost a worker, the password could be fine.
+PASSWORD_POOL_ERRORS = (TimeoutError, BrokenProcessPool)
+
+class TooManyPasswordChecks(Exception):
+    pass
+
+_executor = None
+_executor_lock = threading.Lock()
+_active_checks = {}
+_active_checks_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers only import bcrypt, and forking a process that already runs threads is unsafe.
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+    return _executor
+
+def run_in_pool(function, *args):
+    if not PASSWORD_HASH_WORKERS:
+        return function(*args)
+
+    executor = get_executor()
+    try:
+        return executor.submit(function, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+    except BrokenProcessPool:
+        discard_executor(executor)
+        raise
+
+def discard_executor(executor):
+    # A broken pool rejects every later task, so the next call starts a new one.
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def encode_password(password):
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+def hash_password(password, rounds=BCRYPT_LOG_ROUNDS):
+    salt = bcrypt.gensalt(rounds)
+    return run_in_pool(bcrypt.hashpw, encode_password(password), salt).decode('utf-8')
+
+def check_password(password_hash, password):
+    try:
+        return run_in_pool(bcrypt.checkpw, encode_password(password), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+def needs_rehash(password_hash, rounds=BCRYPT_LOG_ROUNDS):
+    try:
+        return int(password_hash.split('$')[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+@contextmanager
+def password_check_slot(username):
+    with _active_checks_lock:
+        active = _active_checks.get(username, 0)
+        if active >= PASSWORD_MAX_CONCURRENT_CHECKS:
+            raise TooManyPasswordChecks(username)
+        _active_checks[username] = active + 1
+
+    try:
+        yield
+    finally:
+        with _active_checks_lock:
+            _active_checks[username] -= 1
+            if not _active_checks[username]:
+                del _active_checks[username]
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from sqlalchemy import or_, select
+
+from app import db
+from app.models import Book, Borrow, Invoice, Review, User
+from app.utils import borrow_summary_statement
+
+def hot_queries():
+    now = datetime.utcnow()
+    user_id, book_id, payment_id = 1, 1, 'payment'
+
+    return [
+        ('borrow summary', borrow_summary_statement(user_id, now)),
+        ('active borrow of a book', select(Borrow).where(Borrow.book_id == book_id, Borrow.user_id == user_id, Borrow.returned == False).limit(1)),
+        ('active borrows in a cart', select(Borrow.book_id).where(Borrow.user_id == user_id, Borrow.returned == False, Borrow.book_id.in_([1, 2, 3]))),
+        ('returned borrow of a book', select(Borrow).where(Borrow.user_id == user_id, Borrow.book_id == book_id, Borrow.returned == True, Borrow.payment_status == 'success').limit(1)),
+        ('borrows of a book', select(Borrow).where(Borrow.book_id == book_id, Borrow.user_id == user_id)),
+        ('user borrows page', select(Borrow, Book).join(Book, Borrow.book_id == Book.id).where(Borrow.user_id == user_id, Borrow.borrow_date < now).order_by(Borrow.borrow_date.desc(), Borrow.id.desc()).limit(50)),
+        ('borrows by payment', select(Borrow).where(Borrow.payment_id.in_([payment_id]))),
+        ('pending payments', select(Borrow).where(Borrow.payment_status == 'pending', Borrow.payment_id != None).order_by(Borrow.payment_checked_at.asc().nullsfirst()).limit(500)),
+        ('invoice of a borrow', select(Invoice).where(or_(Invoice.payment_id == payment_id, Invoice.borrow_id == 1)).limit(1)),
+        ('invoice items', select(Book.title, Book.author, Book.rental_price).join(Borrow, Borrow.book_id == Book.id).where(Borrow.payment_id == payment_id, Borrow.user_id == user_id)),
+        ('book reviews page', select(Review, User.username).join(User, Review.user_id == User.id).where(Review.book_id == book_id, Review.timestamp < now).order_by(Review.timestamp.desc(), Review.id.desc()).limit(50)),
+        ('existing review', select(Review).where(Review.user_id == user_id, Review.book_id == book_id).limit(1))
+    ]
+
+def compile_statement(statement, dialect):
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        return str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)
+    return str(compiled), compiled.params
+
+def sqlite_plan(connection, statement):
+    sql, params = compile_statement(statement, connection.dialect)
+    details = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params)]
+    # "SCAN table" and "SCAN table USING INDEX" both visit every row; only "SEARCH" narrows the range.
+    full_scans = [detail for detail in details if detail.startswith('SCAN ') and not detail.startswith('SCAN (')]
+    return details, full_scans
+
+def postgres_plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from postgres_plan_nodes(child)
+
+def postgres_plan(connection, statement):
+    sql, params = compile_statement(statement, connection.dialect)
+    # Tiny development tables make sequential scans look cheaper, so only fall back to one when no index applies.
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}', params).scalar()[0]['Plan']
+
+    details, full_scans = [], []
+    for node in postgres_plan_nodes(plan):
+        detail = ' '.join(filter(None, (node['Node Type'], node.get('Relation Name'), node.get('Index Name'), node.get('Index Cond'))))
+        details.append(detail)
+        if node['Node Type'] == 'Seq Scan' or (node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node):
+            full_scans.append(detail)
+    return details, full_scans
+
+def check_query_plans(engine=None):
+    engine = engine or db.engine
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        explain = sqlite_plan
+    elif dialect == 'postgresql':
+        explain = postgres_plan
+    else:
+        raise RuntimeError(f'Query plans cannot be checked on {dialect}')
+
+    results = []
+    with engine.connect() as connection:
+        for name, statement in hot_queries():
+            transaction = connection.begin()
+            try:
+                details, full_scans = explain(connection, statement)
+            finally:
+                transaction.rollback()
+            results.append((name, details, full_scans))
+
+    return results
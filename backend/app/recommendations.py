@@ -0,0 +1,165 @@
+import itertools
+import os
+import tempfile
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, func, insert, select
+
+from app import app, db
+from app.models import Borrow, BookRelation
+from app.cache import bump_versions
+from app.constants import RECOMMENDATIONS_STATE_PATH, RECOMMENDATIONS_TOP_K, RECOMMENDATIONS_MIN_CO_BORROWS
+
+class CoBorrowMatrix:
+    # counts[a, b] is the number of users who borrowed both books, the diagonal the number of users who borrowed a book.
+    def __init__(self, counts, last_borrow_id):
+        self.counts = counts
+        self.last_borrow_id = last_borrow_id
+
+    @classmethod
+    def empty(cls):
+        return cls(sparse.csr_matrix((0, 0), dtype=np.int32), 0)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls.empty()
+
+        with np.load(path) as state:
+            counts = sparse.csr_matrix((state['data'], state['indices'], state['indptr']), shape=tuple(state['shape']))
+            return cls(counts, int(state['last_borrow_id']))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(descriptor, 'wb') as file:
+            np.savez(
+                file,
+                data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+                shape=np.array(self.counts.shape), last_borrow_id=np.array(self.last_borrow_id)
+            )
+        os.replace(temporary_path, path)
+
+    def add(self, previous_pairs, new_pairs):
+        size = max(self.counts.shape[0], int(new_pairs[:, 1].max()) + 1)
+        users, user_rows = np.unique(np.concatenate((previous_pairs[:, 0], new_pairs[:, 0])), return_inverse=True)
+        previous = user_book_matrix(user_rows[:len(previous_pairs)], previous_pairs[:, 1], (len(users), size))
+        added = user_book_matrix(user_rows[len(previous_pairs):], new_pairs[:, 1], (len(users), size))
+
+        # With A the user x book matrix, A'A = AA + AN + NA + NN for the previous borrows A and new borrows N.
+        cross = previous.T @ added
+        delta = (cross + cross.T + added.T @ added).tocsr()
+
+        counts = self.counts.copy()
+        counts.resize((size, size))
+        self.counts = (counts + delta).tocsr()
+        return np.unique(delta.nonzero()[0])
+
+def user_book_matrix(user_rows, book_ids, shape):
+    return sparse.csr_matrix((np.ones(len(user_rows), dtype=np.int32), (user_rows, book_ids)), shape=shape)
+
+def state_path():
+    return RECOMMENDATIONS_STATE_PATH or os.path.join(app.instance_path, 'co_borrows.npz')
+
+def read_columns(statement, width):
+    # Flattening the rows is much faster than letting numpy inspect every row object.
+    rows = db.session.execute(statement)
+    return np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64).reshape(-1, width)
+
+def read_new_borrows(last_borrow_id):
+    return read_columns(
+        select(Borrow.id, Borrow.user_id, Borrow.book_id)
+        .where(Borrow.id > last_borrow_id, Borrow.user_id != None, Borrow.book_id != None),
+        3
+    )
+
+def read_previous_pairs(user_ids, last_borrow_id, chunk_size=500):
+    chunks = [
+        read_columns(
+            select(Borrow.user_id, Borrow.book_id).distinct()
+            .where(Borrow.user_id.in_(user_ids[index:index + chunk_size].tolist()), Borrow.id <= last_borrow_id, Borrow.book_id != None),
+            2
+        )
+        for index in range(0, len(user_ids), chunk_size)
+    ]
+    return np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+def distinct_pairs(pairs):
+    return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+def new_pairs_only(previous_pairs, new_pairs):
+    # Borrowing a book again does not make it co-borrowed again.
+    width = int(max(previous_pairs[:, 1].max(initial=0), new_pairs[:, 1].max())) + 1
+    seen = np.isin(new_pairs[:, 0] * width + new_pairs[:, 1], previous_pairs[:, 0] * width + previous_pairs[:, 1])
+    return new_pairs[~seen]
+
+def top_related(counts, book_ids, top_k=RECOMMENDATIONS_TOP_K, min_co_borrows=RECOMMENDATIONS_MIN_CO_BORROWS):
+    borrowers = counts.diagonal().astype(np.float64)
+    relations = []
+    for book_id in book_ids:
+        start, end = counts.indptr[book_id], counts.indptr[book_id + 1]
+        related, co_borrows = counts.indices[start:end], counts.data[start:end]
+        keep = (related != book_id) & (co_borrows >= min_co_borrows)
+        related, co_borrows = related[keep], co_borrows[keep]
+        if not len(related):
+            continue
+
+        # Cosine similarity, so that books everyone borrows do not top every list.
+        scores = co_borrows / np.sqrt(borrowers[book_id] * borrowers[related])
+        best = np.argpartition(-scores, top_k - 1)[:top_k] if len(related) > top_k else np.arange(len(related))
+        best = best[np.lexsort((-co_borrows[best], -scores[best]))]
+
+        relations.extend(
+            {'book_id': int(book_id), 'related_book_id': int(related_id), 'co_borrows': int(count), 'score': float(score)}
+            for related_id, count, score in zip(related[best], co_borrows[best], scores[best])
+        )
+    return relations
+
+def store_relations(book_ids, relations, chunk_size=500):
+    by_book = {}
+    for relation in relations:
+        by_book.setdefault(relation['book_id'], []).append(relation)
+
+    for index in range(0, len(book_ids), chunk_size):
+        chunk = book_ids[index:index + chunk_size].tolist()
+        db.session.execute(delete(BookRelation).where(BookRelation.book_id.in_(chunk)))
+        rows = [relation for book_id in chunk for relation in by_book.get(book_id, ())]
+        if rows:
+            # A Core insert of the table skips the per-row bookkeeping of ORM bulk inserts.
+            db.session.execute(insert(BookRelation.__table__), rows)
+        db.session.commit()
+
+def build_recommendations(full=False):
+    path = state_path()
+    matrix = CoBorrowMatrix.empty() if full else CoBorrowMatrix.load(path)
+
+    last_borrow_id = db.session.scalar(select(func.max(Borrow.id))) or 0
+    if matrix.last_borrow_id > last_borrow_id:
+        # The borrows the matrix was built from are gone, e.g. after seeding the database again.
+        matrix = CoBorrowMatrix.empty()
+
+    if matrix.last_borrow_id == 0:
+        db.session.execute(delete(BookRelation))
+        db.session.commit()
+
+    borrows = read_new_borrows(matrix.last_borrow_id)
+    if not len(borrows):
+        return 0, 0
+
+    new_pairs = distinct_pairs(borrows[:, 1:])
+    previous_pairs = np.empty((0, 2), dtype=np.int64)
+    if matrix.last_borrow_id:
+        previous_pairs = read_previous_pairs(np.unique(new_pairs[:, 0]), matrix.last_borrow_id)
+        new_pairs = new_pairs_only(previous_pairs, new_pairs)
+
+    changed_books = np.empty(0, dtype=np.int64)
+    if len(new_pairs):
+        changed_books = matrix.add(previous_pairs, new_pairs)
+        store_relations(changed_books, top_related(matrix.counts, changed_books))
+
+    matrix.last_borrow_id = int(borrows[:, 0].max())
+    matrix.save(path)
+    bump_versions('recommendations')
+    return len(borrows), len(changed_books)
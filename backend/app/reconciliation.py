@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from app import app, db
+from app.models import Borrow
+from app.constants import PAYMENT_ASYNC, PAYMENT_SERVICE_SECRET, PAYMENT_HOSTNAME, RECONCILE_BATCH_SIZE, RECONCILE_CHUNK_SIZE, RECONCILE_CONCURRENCY
+from app.utils import apply_payment_status, generate_short_numerical_id
+from app.http_client import payment_client
+from app.async_http_client import payment_async_client
+from app.edifact import encode_status_query, decode_payment_statuses
+
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+def status_query(payment_ids):
+    return encode_status_query(generate_short_numerical_id(len(payment_ids), payment_ids[0]), payment_ids)
+
+def fetch_payment_statuses(payment_ids):
+    try:
+        response = payment_client.post(f'http://{PAYMENT_HOSTNAME}/payment_status/bulk', data=status_query(payment_ids), headers={"Content-Type": "text/plain"}, idempotent=True)
+    except requests.RequestException:
+        app.logger.warning('Bulk payment status request for %s payments failed', len(payment_ids))
+        return None
+
+    return read_payment_statuses(response)
+
+async def fetch_payment_statuses_async(payment_ids, semaphore):
+    async with semaphore:
+        try:
+            response = await payment_async_client.request_async('POST', f'http://{PAYMENT_HOSTNAME}/payment_status/bulk', data=status_query(payment_ids), headers={"Content-Type": "text/plain"}, idempotent=True)
+        except requests.RequestException:
+            app.logger.warning('Bulk payment status request for %s payments failed', len(payment_ids))
+            return None
+
+    return read_payment_statuses(response)
+
+async def gather_payment_statuses(chunks):
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+    return await asyncio.gather(*(fetch_payment_statuses_async(chunk, semaphore) for chunk in chunks))
+
+def read_payment_statuses(response):
+    if response.status_code != 200:
+        return None
+
+    edifact_response = response.text
+    calculated_signature = hmac.new(PAYMENT_SERVICE_SECRET.encode(), edifact_response.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(response.headers.get('X-Signature', ''), calculated_signature):
+        app.logger.warning('Bulk payment status response has an invalid signature')
+        return None
+
+    return decode_payment_statuses(edifact_response)
+
+def reconcile_pending_payments():
+    borrows = Borrow.query.filter(Borrow.payment_status == 'pending', Borrow.payment_id != None) \
+        .order_by(Borrow.payment_checked_at.asc().nullsfirst()) \
+        .limit(RECONCILE_BATCH_SIZE).all()
+
+    if not borrows:
+        return 0
+
+    chunks = list(chunked(list({borrow.payment_id for borrow in borrows}), RECONCILE_CHUNK_SIZE))
+    if PAYMENT_ASYNC:
+        results = payment_async_client.run(gather_payment_statuses(chunks))
+    else:
+        with ThreadPoolExecutor(max_workers=RECONCILE_CONCURRENCY) as executor:
+            results = list(executor.map(fetch_payment_statuses, chunks))
+
+    # Payments the service does not know are checked too, otherwise they would fill every batch and starve the rest.
+    statuses = {}
+    for chunk, chunk_statuses in zip(chunks, results):
+        if chunk_statuses is not None:
+            statuses.update(dict.fromkeys(chunk, 'unknown'))
+            statuses.update(chunk_statuses)
+
+    checked_at = datetime.utcnow()
+    updated = 0
+    for borrow in borrows:
+        status = statuses.get(borrow.payment_id)
+        if status is None:
+            continue
+
+        borrow.payment_checked_at = checked_at
+        if status not in ('pending', 'unknown'):
+            apply_payment_status(borrow, status)
+            updated += 1
+
+    db.session.commit()
+
+    return updated
+
+def run_reconciliation_worker(interval):
+    app.logger.info('Payment reconciliation worker started, interval %ss', interval)
+    while True:
+        started = time.monotonic()
+        try:
+            updated = reconcile_pending_payments()
+            if updated:
+                app.logger.info('Reconciled %s payments', updated)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Payment reconciliation failed')
+        finally:
+            db.session.remove()
+
+        time.sleep(max(0, interval - (time.monotonic() - started)))
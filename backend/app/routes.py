@@ -1,32 +1,54 @@
 from datetime import datetime, timedelta
 import hashlib
 import hmac
-import sys
-from flask import request, jsonify
+import json
+from flask import Response, request, jsonify, send_file
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, load_only
 
-from pydifact.segmentcollection import Interchange
-from pydifact.segments import Segment
-
-from app import app, db, bcrypt, database_initialized
-from app.models import Invoice, User, Book, Borrow, Review
+from app import app, db
+from app.models import User, Book, Borrow, Review, BookRelation
 from app.schemas import BorrowSchema, BookSchema, InvoiceSchema
-from app.constants import PAYMENT_SERVICE_SECRET, PUBLIC_HOSTNAME, PAYMENT_HOSTNAME
+from app.constants import PAYMENT_SERVICE_SECRET, PUBLIC_HOSTNAME, PAYMENT_HOSTNAME, CATALOG_MAX_PAGE_SIZE, CHECKOUT_MAX_BOOKS, BORROWS_MAX_PAGE_SIZE, REVIEWS_MAX_PAGE_SIZE, COVER_MAX_AGE, RECOMMENDATIONS_TOP_K, SUGGEST_LIMIT
 from app.utils import *
+from app.search import get_search_provider
+from app.suggest import book_suggestions
+from app.cache import cached_response
+from app.http_client import CircuitOpenError
+from app.async_http_client import payment_transport
+from app.metrics import registry
+from app.cover_store import COVER_HASH_PATTERN, cover_store
+from app.passwords import PASSWORD_POOL_ERRORS, TooManyPasswordChecks, check_password, hash_password, needs_rehash, password_check_slot
+from app.edifact import BorrowingRequest, BorrowingLine, encode_borrowing_request, decode_payment_initiated, decode_payment_statuses
 
 import requests
         
 @app.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
-    user = User.query.filter_by(username=data.get('username')).first()
+    username = data.get('username')
+    password = data.get('password')
+    user = User.query.filter_by(username=username).first()
+
+    if not user or not password:
+        return '', 401
+
+    try:
+        with password_check_slot(username):
+            if not check_password(user.password_hash, password):
+                return '', 401
 
-    if user and bcrypt.check_password_hash(user.password_hash, data.get('password')):
-        access_token = create_access_token(identity=user.id)
-        return jsonify(access_token=access_token), 200
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
+    except TooManyPasswordChecks:
+        return jsonify({'too_many_attempts': 'true'}), 429
+    except PASSWORD_POOL_ERRORS:
+        return jsonify({'busy': 'true'}), 503
 
-    return '', 401
+    access_token = create_access_token(identity=user.id)
+    return jsonify(access_token=access_token), 200
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -41,10 +63,15 @@ def register():
     if User.query.filter((User.username == username) | (User.email == email)).first():
         return jsonify({'already_exist': 'true'}), 400
 
+    try:
+        password_hash = hash_password(password)
+    except PASSWORD_POOL_ERRORS:
+        return jsonify({'busy': 'true'}), 503
+
     user = User(
         username=username, 
         email=email, 
-        password_hash=bcrypt.generate_password_hash(data.get('password')).decode('utf-8')
+        password_hash=password_hash
     )
     db.session.add(user)
     db.session.commit()
@@ -52,6 +79,7 @@ def register():
     return '', 201
 
 @app.route('/books', methods=['GET'])
+@cached_response(lambda: ['catalog'])
 def get_books():
     query = request.args.get('query')
     author = request.args.get('author')
@@ -61,169 +89,251 @@ def get_books():
     sort_field = request.args.get('sortField', 'title') 
     sort_order = request.args.get('sortOrder', 'asc')
     is_available = request.args.get('isAvailable', 'false') == 'true'
-    
-    base_query = Book.query
-
-    if is_available:
-        borrows_subquery = db.session.query(
-            Borrow.book_id,
-            func.count('*').label('num_borrows')
-        ).filter_by(returned=False).group_by(Borrow.book_id).subquery()
-
-        base_query = db.session.query(Book).outerjoin(
-            borrows_subquery, borrows_subquery.c.book_id == Book.id)
-        base_query = base_query.filter(
-            (Book.total_copies > borrows_subquery.c.num_borrows) |
-            (borrows_subquery.c.num_borrows == None) 
-        )
-
-    if query:
-        base_query = base_query.filter(Book.title.ilike(f'%{query}%'))
-    if author:
-        base_query = base_query.filter(Book.author.ilike(f'%{author}%'))
-    if isbn:
-        base_query = base_query.filter(Book.isbn.ilike(f'%{isbn}%'))
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
+
+    if sort_field not in CATALOG_SORT_FIELDS:
+        return jsonify({'invalid_sort_field': 'true'}), 400
+
+    book_schema = BookSchema()
+    computed_fields = CATALOG_COMPUTED_FIELDS
+    if fields:
+        requested_fields = set(fields.split(','))
+        computed_fields = tuple(field for field in CATALOG_COMPUTED_FIELDS if field in requested_fields)
+        book_fields = requested_fields.difference(computed_fields)
+
+        if not book_fields.issubset(book_schema.fields):
+            return jsonify({'invalid_fields': 'true'}), 400
+
+        book_schema = BookSchema(only=book_fields)
+
+    base_query = book_catalog_query(available_only=is_available)
+
+    search_terms = {field: term for field, term in (('title', query), ('author', author), ('isbn', isbn)) if term}
+    rank = None
+    if search_terms:
+        base_query, rank = get_search_provider().apply(base_query, search_terms)
+        if rank is not None:
+            base_query = base_query.add_columns(rank.label('rank'))
     if price_from is not None:
         base_query = base_query.filter(Book.rental_price >= price_from)
     if price_to is not None:
         base_query = base_query.filter(Book.rental_price <= price_to)
 
-    if sort_order == 'asc':
-        base_query = base_query.order_by(getattr(Book, sort_field).asc())
+    if sort_field == 'rank' and rank is None:
+        sort_field = 'title'
+    sort_column = rank if sort_field == 'rank' else getattr(Book, sort_field)
+    base_query = base_query.order_by(*keyset_order(sort_column, Book.id, sort_order))
+
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'invalid_cursor': 'true'}), 400
+        base_query = base_query.filter(keyset_filter(sort_column, Book.id, sort_order, last_value, last_id))
+
+    if fields:
+        loaded_fields = set(book_schema.only) | ({sort_field} - {'rank'})
+        if 'cover_source' in loaded_fields:
+            loaded_fields.add('cover_hash')
+        base_query = base_query.options(load_only(*[getattr(Book, field) for field in loaded_fields]))
+
+    next_cursor = None
+    if limit is not None:
+        limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+        rows = base_query.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_book = rows[-1][0]
+            last_value = rows[-1].rank if sort_field == 'rank' else getattr(last_book, sort_field)
+            next_cursor = encode_cursor(last_value, last_book.id)
     else:
-        base_query = base_query.order_by(getattr(Book, sort_field).desc())
+        rows = base_query.all()
 
-    books = base_query.all()
+    books_data = [dump_catalog_row(row, book_schema, computed_fields) for row in rows]
 
-    book_schema = BookSchema()
-    books_data = []
-    for book in books:
-        book_dict = book_schema.dump(book)
-        book_dict['currently_available'] = book.total_copies - book.borrows.filter_by(returned=False).count()
-        book_dict['average_rating'] = get_book_average_rating(book.id)
-        books_data.append(book_dict)
+    response = jsonify(books_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+    return response
 
-    return jsonify(books_data)
+@app.route('/books/suggest', methods=['GET'])
+def suggest_books():
+    query = request.args.get('query', '')
+    limit = max(1, min(request.args.get('limit', SUGGEST_LIMIT, type=int), SUGGEST_LIMIT))
+
+    return jsonify(book_suggestions.suggest(query, limit))
 
 @app.route('/books/<int:book_id>', methods=['GET'])
+@cached_response(lambda book_id: ['books', f'book:{book_id}'])
 def get_book_by_id(book_id):
-    book = Book.query.get_or_404(book_id)
-    book_schema = BookSchema()
-    book_data = book_schema.dump(book)
-    book_data['currently_available'] = book.total_copies - book.borrows.filter_by(returned=False).count()
-    book_data['average_rating'] = get_book_average_rating(book_id)
+    row = book_catalog_query().filter(Book.id == book_id).first_or_404()
+    book_data = dump_catalog_row(row, BookSchema())
 
     return jsonify(book_data)
 
+def checkout_books(books):
+    if not payment_transport.is_available(f'http://{PAYMENT_HOSTNAME}'):
+        return jsonify({'payment_unavailable': 'true'}), 503
+
+    # Reserve in id order so that concurrent carts lock the book rows in the same order.
+    books = sorted(books, key=lambda book: book.id)
+    book_ids = [book.id for book in books]
+    lines = [BorrowingLine(book.id, book.title, book.rental_price) for book in books]
+
+    unavailable = [book_id for book_id in book_ids if not reserve_book_copy(book_id)]
+    if unavailable:
+        db.session.rollback()
+        return jsonify({'not_available': 'true', 'book_ids': unavailable}), 400
+    db.session.commit()
+
+    edifact_str = encode_borrowing_request(generate_short_numerical_id(get_jwt_identity(), book_ids[0]), BorrowingRequest(
+        user_id=get_jwt_identity(),
+        lines=lines,
+        callback_url=f'http://{PUBLIC_HOSTNAME}/update_payment_status'
+    ))
+
+    payment_id, payment_url = None, None
+
+    # The copies are already committed as reserved, so any failure up to a parsed payment has to release them.
+    try:
+        response = payment_transport.post(f'http://{PAYMENT_HOSTNAME}/initiate_payment', data=edifact_str, headers={"Content-Type": "text/plain"})
+
+        if response.status_code == 200:
+            json_response = response.json()
+            edi_response = json_response['edi']
+
+            payment_id = decode_payment_initiated(edi_response).payment_id
+            payment_url = json_response['payment_url']
+    except CircuitOpenError:
+        for book_id in book_ids:
+            release_book_copy(book_id)
+        db.session.commit()
+        return jsonify({'payment_unavailable': 'true'}), 503
+    except requests.RequestException:
+        pass
+    except Exception:
+        app.logger.exception('Could not read the payment initiation response')
+
+    if not payment_id or not payment_url:
+        for book_id in book_ids:
+            release_book_copy(book_id)
+        db.session.commit()
+        return '', 400
+
+    borrows = [Borrow(
+        user_id=get_jwt_identity(),
+        book_id=book_id,
+        payment_status='pending',
+        payment_id=payment_id,
+        borrow_date=datetime.utcnow(),
+        payment_url=payment_url,
+        return_by_date=datetime.utcnow() - timedelta(days=3)
+    ) for book_id in book_ids]
+
+    db.session.add_all(borrows)
+    forget_borrow_summary(get_jwt_identity())
+    db.session.flush()
+    borrow_ids = [borrow.id for borrow in borrows]
+    db.session.commit()
+
+    return jsonify({'payment_url': payment_url, 'borrow_ids': borrow_ids}), 200
+
+@app.route('/books/<int:book_id>/related', methods=['GET'])
+@cached_response(lambda book_id: ['catalog', 'recommendations'])
+def get_related_books(book_id):
+    limit = max(1, min(request.args.get('limit', RECOMMENDATIONS_TOP_K, type=int), RECOMMENDATIONS_TOP_K))
+
+    rows = book_catalog_query() \
+        .join(BookRelation, BookRelation.related_book_id == Book.id) \
+        .filter(BookRelation.book_id == book_id) \
+        .order_by(BookRelation.score.desc(), BookRelation.related_book_id) \
+        .limit(limit) \
+        .all()
+    if not rows:
+        Book.query.get_or_404(book_id)
+
+    book_schema = BookSchema()
+    return jsonify([dump_catalog_row(row, book_schema) for row in rows])
+
+@app.route('/covers/<cover_hash>', methods=['GET'])
+def get_cover(cover_hash):
+    if not COVER_HASH_PATTERN.fullmatch(cover_hash):
+        return '', 404
+
+    try:
+        # The hash names the content, so the file behind a URL never changes.
+        response = send_file(cover_store.path(cover_hash), mimetype='image/jpeg', etag=cover_hash, max_age=COVER_MAX_AGE, conditional=True)
+    except FileNotFoundError:
+        return '', 404
+
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/borrow/<int:book_id>', methods=['POST'])
 @jwt_required()
 def borrow_book(book_id):
     book = Book.query.get_or_404(book_id)
     
-    overdue_borrows = Borrow.query.filter(Borrow.user_id == get_jwt_identity(), Borrow.returned == False, Borrow.return_by_date < datetime.utcnow()).count()
-    if overdue_borrows > 0:
+    if borrow_summary(get_jwt_identity())['overdue'] > 0:
         return '', 403
 
-    if not is_book_available(book):
-        return jsonify({'not_available': 'true'}), 400
-
     existing_borrow = Borrow.query.filter_by(book_id=book_id, user_id=get_jwt_identity(), returned=False).first()
 
     if existing_borrow:
         return jsonify({'already_borrowed': 'true'}), 400
-    
-    edifact_message = Interchange("BiblioConnectAPI", "PaymentMock", str(generate_short_numerical_id(get_jwt_identity(), book_id)), ("UNOC", 3))
-    
-    edifact_message.add_segment(Segment("BGM", ["351", "Borrowing"]))
-    edifact_message.add_segment(Segment("DTM", ["137", datetime.utcnow().strftime("%Y%m%d"), "102"]))
-    edifact_message.add_segment(Segment("NAD", ["BY", str(get_jwt_identity())]))
-    edifact_message.add_segment(Segment("NAD", ["SU", str(book_id)]))
-    edifact_message.add_segment(Segment("FTX", ["AAI", "Book Title", book.title]))
-    edifact_message.add_segment(Segment("MOA", ["ZZZ", "Amount", str(book.rental_price)]))
-    edifact_message.add_segment(Segment("COM", ["Callback URL", f'http://{PUBLIC_HOSTNAME}/update_payment_status']))
 
-    edifact_str = edifact_message.serialize()
+    return checkout_books([book])
 
-    response = requests.post(f'http://{PAYMENT_HOSTNAME}/initiate_payment', data=edifact_str, headers={"Content-Type": "text/plain"})
-    
-    if response.status_code == 200:
-        json_response = response.json()
-        edi_response = json_response['edi']
-
-        interchange = Interchange.from_str(edi_response)
-
-        payment_id, payment_url = None, json_response['payment_url']
+@app.route('/borrow', methods=['POST'])
+@jwt_required()
+def borrow_books():
+    book_ids = (request.get_json(silent=True) or {}).get('book_ids')
+    if not isinstance(book_ids, list) or not book_ids or not all(isinstance(book_id, int) and not isinstance(book_id, bool) for book_id in book_ids):
+        return jsonify({'book_ids': 'true'}), 400
 
-        for segment in interchange.segments:
-            if segment.tag == 'PID':
-                payment_id = segment.elements[0][2]
-                break
+    book_ids = list(dict.fromkeys(book_ids))
+    if len(book_ids) > CHECKOUT_MAX_BOOKS:
+        return jsonify({'too_many_books': 'true', 'limit': CHECKOUT_MAX_BOOKS}), 400
 
-        if not payment_id or not payment_url:
-            return '', 400
+    books = Book.query.filter(Book.id.in_(book_ids)).all()
+    if len(books) != len(book_ids):
+        return '', 404
 
-        borrow = Borrow(
-            user_id=get_jwt_identity(),
-            book_id=book_id,
-            payment_status='pending',
-            payment_id=payment_id,
-            borrow_date=datetime.utcnow(),
-            payment_url=payment_url,
-            return_by_date=datetime.utcnow() - timedelta(days=3)
-        )
+    if borrow_summary(get_jwt_identity())['overdue'] > 0:
+        return '', 403
 
-        db.session.add(borrow)
-        db.session.commit()
+    existing_borrows = db.session.query(Borrow.book_id).filter(Borrow.user_id == get_jwt_identity(), Borrow.returned == False, Borrow.book_id.in_(book_ids)).all()
+    if existing_borrows:
+        return jsonify({'already_borrowed': 'true', 'book_ids': sorted({book_id for book_id, in existing_borrows})}), 400
 
-        return jsonify({'payment_url': borrow.payment_url}), 200
-    else:
-        return '', 400
+    return checkout_books(books)
 
 @app.route('/update_payment_status', methods=['POST'])
 def update_payment_status():
-    received_signature = request.headers.get('X-Signature')
+    received_signature = request.headers.get('X-Signature', '')
 
     expected_signature = hmac.new(PAYMENT_SERVICE_SECRET.encode(), msg=request.data, digestmod=hashlib.sha256).hexdigest()
 
     if not hmac.compare_digest(received_signature, expected_signature):
         return '', 401
 
-    edifact_message = request.data.decode('utf-8')
-
-    segments = Interchange.from_str(edifact_message).segments
-
-    payment_id = None
-    status = None
+    statuses = decode_payment_statuses(request.data.decode('utf-8'))
 
-    for segment in segments:
-        if segment.tag == 'PID':
-            payment_id = segment.elements[0][2]
-        elif segment.tag == 'STS':
-            status = segment.elements[0]
-
-    if not payment_id or not status:
+    if not statuses:
         return '', 400
 
-    borrow = Borrow.query.filter_by(payment_id=payment_id).first()
-    if borrow:
-        borrow.payment_status = status
-        if status.lower() != 'success':
-            borrow.returned = True
-        else:
-            existing_invoice = Invoice.query.filter_by(borrow_id=borrow.id).first()
-    
-            if not existing_invoice:
-                invoice = Invoice(
-                    borrow_id=borrow.id,
-                    payment_date=datetime.utcnow()
-                )
-
-                db.session.add(invoice)
-        
-        db.session.commit()
-        return '', 204
-    else:
+    borrows = Borrow.query.filter(Borrow.payment_id.in_(statuses)).all()
+    if not borrows:
         return '', 404
+
+    for borrow in borrows:
+        apply_payment_status(borrow, statuses[borrow.payment_id])
+
+    db.session.commit()
+    return '', 204
     
 @app.route('/book/status/<int:book_id>', methods=['GET'])
 @jwt_required()
@@ -232,8 +342,7 @@ def check_book_status(book_id):
     Book.query.get_or_404(book_id)
     
     borrows = Borrow.query.filter_by(book_id=book_id, user_id=current_user_id).all()
-    overdue_borrows = Borrow.query.filter(Borrow.user_id == get_jwt_identity(), Borrow.returned == False, Borrow.return_by_date < datetime.utcnow()).count()
-    if overdue_borrows > 0:
+    if borrow_summary(get_jwt_identity())['overdue'] > 0:
         return '', 403
     
     if not borrows:
@@ -254,11 +363,11 @@ def check_book_status(book_id):
 @jwt_required()
 def return_book(borrow_id):
     borrow = Borrow.query.get_or_404(borrow_id)
-    if borrow.user_id != get_jwt_identity() or borrow.returned:
+    if borrow.user_id != get_jwt_identity() or not mark_borrow_returned(borrow.id, return_date=datetime.utcnow()):
         return '', 400
 
-    borrow.returned = True
-    borrow.return_date = datetime.utcnow()
+    release_book_copy(borrow.book_id)
+    forget_borrow_summary(borrow.user_id)
     db.session.commit()
 
     return '', 200
@@ -279,8 +388,9 @@ def authorize():
     current_user_id = get_jwt_identity()
     user = User.query.get_or_404(current_user_id)
 
-    upcoming_returns = Borrow.query.filter(Borrow.user_id == current_user_id, Borrow.returned == False, Borrow.return_by_date >= datetime.utcnow(), Borrow.return_by_date <= datetime.utcnow() + timedelta(days=5)).count()
-    overdue_returns = Borrow.query.filter(Borrow.user_id == current_user_id, Borrow.returned == False, Borrow.return_by_date < datetime.utcnow()).count()
+    summary = borrow_summary(current_user_id)
+    upcoming_returns = summary['upcoming']
+    overdue_returns = summary['overdue']
 
     notifications = []
     if upcoming_returns > 0:
@@ -305,36 +415,105 @@ def authorize():
 @jwt_required()
 def get_user_borrows():
     current_user_id = get_jwt_identity()
-    borrows = Borrow.query.filter_by(user_id=current_user_id).all()
-    borrows_data = []
-
-    for borrow in borrows:
-        book = Book.query.get(borrow.book_id)
-        book_schema = BookSchema()
-        book_data = book_schema.dump(book)
-
-        borrows_data.append({
-            'borrow_id': borrow.id,
-            'book': book_data,
-            'payment_status': borrow.payment_status,
-            'returned': borrow.returned,
-            'borrow_date': borrow.borrow_date,
-            'return_by_date': borrow.return_by_date,
-            'return_date': borrow.return_date
-        })
+    statuses = request.args.get('status')
+    sort_order = request.args.get('sortOrder', 'desc')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+
+    base_query = Borrow.query.options(joinedload(Borrow.book)).filter(Borrow.user_id == current_user_id)
+
+    if statuses:
+        statuses = statuses.split(',')
+        if not set(statuses).issubset(BORROW_STATUS_FILTERS):
+            return jsonify({'invalid_status': 'true'}), 400
+        base_query = base_query.filter(or_(*[BORROW_STATUS_FILTERS[status] for status in statuses]))
+
+    base_query = base_query.order_by(*keyset_order(Borrow.borrow_date, Borrow.id, sort_order))
+
+    if cursor:
+        try:
+            last_value, last_id = decode_datetime_cursor(cursor)
+        except ValueError:
+            return jsonify({'invalid_cursor': 'true'}), 400
+        base_query = base_query.filter(keyset_filter(Borrow.borrow_date, Borrow.id, sort_order, last_value, last_id))
+
+    next_cursor = None
+    if limit is not None:
+        limit = max(1, min(limit, BORROWS_MAX_PAGE_SIZE))
+        borrows = base_query.limit(limit + 1).all()
+        if len(borrows) > limit:
+            borrows = borrows[:limit]
+            last_borrow = borrows[-1]
+            next_cursor = encode_datetime_cursor(last_borrow.borrow_date, last_borrow.id)
+    else:
+        borrows = base_query.all()
 
-    return jsonify(borrows_data)
+    book_schema = BookSchema()
+    borrows_data = [{
+        'borrow_id': borrow.id,
+        'book': book_schema.dump(borrow.book),
+        'payment_status': borrow.payment_status,
+        'returned': borrow.returned,
+        'borrow_date': borrow.borrow_date,
+        'return_by_date': borrow.return_by_date,
+        'return_date': borrow.return_date
+    } for borrow in borrows]
+
+    response = jsonify(borrows_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+    return response
 
 @app.route('/books/<int:book_id>/reviews', methods=['GET'])
+@cached_response(lambda book_id: ['books', f'book:{book_id}'], when=lambda: 'cursor' not in request.args)
 def get_book_reviews(book_id):
-    reviews = db.session.query(Review, User.username).join(User, Review.user_id == User.id).filter(Review.book_id == book_id).all()
+    sort_order = request.args.get('sortOrder', 'desc')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+
+    base_query = db.session.query(Review, User.username) \
+        .join(User, Review.user_id == User.id) \
+        .filter(Review.book_id == book_id) \
+        .order_by(*keyset_order(Review.timestamp, Review.id, sort_order))
+
+    if cursor:
+        try:
+            last_value, last_id = decode_datetime_cursor(cursor)
+        except ValueError:
+            return jsonify({'invalid_cursor': 'true'}), 400
+        base_query = base_query.filter(keyset_filter(Review.timestamp, Review.id, sort_order, last_value, last_id))
+
+    next_cursor = None
+    if limit is not None:
+        limit = max(1, min(limit, REVIEWS_MAX_PAGE_SIZE))
+        reviews = base_query.limit(limit + 1).all()
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            last_review = reviews[-1][0]
+            next_cursor = encode_datetime_cursor(last_review.timestamp, last_review.id)
+    else:
+        reviews = base_query.all()
+
     reviews_data = [{
         'username': username,
         'content': review.content,
-        'rating': review.rating
+        'rating': review.rating,
+        'timestamp': review.timestamp
     } for review, username in reviews]
 
-    return jsonify(reviews_data)
+    response = jsonify(reviews_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+    if not cursor:
+        book = Book.query.options(load_only(Book.rating_count, Book.average_rating, *[getattr(Book, f'rating_{rating}_count') for rating in RATING_VALUES])).get(book_id)
+        if book:
+            response.headers['X-Rating-Count'] = str(book.rating_count or 0)
+            response.headers['X-Rating-Average'] = str(round(book.average_rating or 0, 2))
+            response.headers['X-Rating-Histogram'] = json.dumps(rating_histogram(book))
+
+    return response
 
 @app.route('/books/<int:book_id>/reviews', methods=['POST'])
 @jwt_required()
@@ -344,14 +523,13 @@ def add_book_review(book_id):
     content = data.get('content')
     rating = data.get('rating')
 
-    overdue_borrows = Borrow.query.filter(Borrow.user_id == get_jwt_identity(), Borrow.returned == False, Borrow.return_by_date < datetime.utcnow()).count()
-    if overdue_borrows > 0:
+    if borrow_summary(get_jwt_identity())['overdue'] > 0:
         return '', 403
 
     if not content or len(content) < 3 or len(content) > 200:
         return jsonify({'length': 'true'}), 400
 
-    if not rating or rating < 1 or rating > 5:
+    if not isinstance(rating, int) or isinstance(rating, bool) or rating < 1 or rating > 5:
         return jsonify({'range': 'true'}), 400
 
     if Review.query.filter_by(user_id=current_user_id, book_id=book_id).first():
@@ -361,8 +539,9 @@ def add_book_review(book_id):
     if not borrow:
         return jsonify({'not_borrowed': 'true'}), 400
 
-    review = Review(user_id=current_user_id, book_id=book_id, content=content, rating=rating)
+    review = Review(user_id=current_user_id, book_id=book_id, content=content, rating=rating, timestamp=datetime.utcnow())
     db.session.add(review)
+    record_book_rating(book_id, rating)
     db.session.commit()
 
     return '', 201
@@ -372,8 +551,7 @@ def add_book_review(book_id):
 def can_add_review(book_id):
     current_user_id = get_jwt_identity()
 
-    overdue_borrows = Borrow.query.filter(Borrow.user_id == get_jwt_identity(), Borrow.returned == False, Borrow.return_by_date < datetime.utcnow()).count()
-    if overdue_borrows > 0:
+    if borrow_summary(get_jwt_identity())['overdue'] > 0:
         return jsonify({'canAddReview': False, 'forbidden': 'true'}), 200
     
     existing_review = Review.query.filter_by(user_id=current_user_id, book_id=book_id).first()
@@ -409,10 +587,19 @@ def get_invoice(borrow_id):
     book = borrow.book
     user = borrow.borrower
     
-    existing_invoice = Invoice.query.filter_by(borrow_id=borrow_id).first()
+    existing_invoice = find_invoice(borrow)
     if not existing_invoice:
         return '', 404
 
+    if existing_invoice.payment_id:
+        items = db.session.query(Book.title, Book.author, Book.rental_price) \
+            .join(Borrow, Borrow.book_id == Book.id) \
+            .filter(Borrow.payment_id == existing_invoice.payment_id, Borrow.user_id == current_user_id) \
+            .order_by(Borrow.id) \
+            .all()
+    else:
+        items = [(book.title, book.author, book.rental_price)]
+
     invoice_schema = InvoiceSchema()
     invoice_data = invoice_schema.dump(existing_invoice)
 
@@ -427,44 +614,12 @@ def get_invoice(borrow_id):
             'title': book.title,
             'author': book.author,
         },
-        'price': book.rental_price
+        'items': [{'title': title, 'author': author, 'price': price} for title, author, price in items],
+        'price': sum(price for _, _, price in items)
     })
 
     return jsonify(invoice_data), 201
 
-@app.before_request
-def update_payment_statuses():
-    global database_initialized
-    if database_initialized:
-        pass
-    database_initialized = True
-    borrows = Borrow.query.all()
-    for borrow in borrows:
-        edifact_message = Interchange("BiblioConnectAPI", "PaymentMock", str(borrow.payment_id), ("UNOC", 3))
-        edifact_message.add_segment(Segment("PID", [str(borrow.payment_id)]))
-        edifact_str = edifact_message.serialize()
-        response = requests.get(f'http://{PAYMENT_HOSTNAME}/payment_status', data=edifact_str)
-
-        if response.status_code == 200:
-            edifact_response = response.text
-            segments = Interchange.from_str(edifact_response).segments
-
-            payment_id = None
-            status = None
-
-            for segment in segments:
-                if segment.tag == 'PID':
-                    payment_id = segment.elements[0]
-                elif segment.tag == 'STS':
-                    status = segment.elements[0]
-
-            if payment_id and status:
-                secret = PAYMENT_SERVICE_SECRET
-                calculated_signature = hmac.new(secret.encode(), edifact_response.encode(), hashlib.sha256).hexdigest()
-                
-                request_signature = response.headers["X-Signature"]
-                
-                if request_signature == calculated_signature:
-                    borrow.payment_status = status
-
-    db.session.commit()
\ No newline at end of file
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,10 +1,14 @@
 from app.models import Book, Borrow, Invoice
 from app import ma
+from app.cover_store import cover_url
 
 class BookSchema(ma.SQLAlchemyAutoSchema):
+    cover_source = ma.Function(cover_url)
+
     class Meta:
         model = Book
         include_fk = True
+        exclude = ('cover_hash', 'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count')
 
 class BorrowSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
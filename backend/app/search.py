@@ -0,0 +1,131 @@
+import threading
+
+from sqlalchemy import Float, Integer, func, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db
+from app.models import Book
+
+SEARCH_FIELDS = ('title', 'author', 'isbn')
+
+class SearchProvider:
+    name = 'like'
+
+    def ensure_index(self):
+        pass
+
+    def rebuild_index(self):
+        pass
+
+    def apply(self, query, terms):
+        for field, term in terms.items():
+            query = query.filter(getattr(Book, field).ilike(f'%{term}%'))
+        return query, None
+
+class SqliteFtsSearchProvider(SearchProvider):
+    name = 'sqlite-fts5'
+    min_term_length = 3
+
+    def ensure_index(self):
+        exists = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_book_fts'")).first()
+        if exists:
+            return
+
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE search_book_fts USING fts5("
+            "title, author, isbn, content='book', content_rowid='id', tokenize='trigram')"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER search_book_fts_ai AFTER INSERT ON book BEGIN "
+            "INSERT INTO search_book_fts(rowid, title, author, isbn) VALUES (new.id, new.title, new.author, new.isbn); "
+            "END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER search_book_fts_ad AFTER DELETE ON book BEGIN "
+            "INSERT INTO search_book_fts(search_book_fts, rowid, title, author, isbn) VALUES ('delete', old.id, old.title, old.author, old.isbn); "
+            "END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER search_book_fts_au AFTER UPDATE OF title, author, isbn ON book BEGIN "
+            "INSERT INTO search_book_fts(search_book_fts, rowid, title, author, isbn) VALUES ('delete', old.id, old.title, old.author, old.isbn); "
+            "INSERT INTO search_book_fts(rowid, title, author, isbn) VALUES (new.id, new.title, new.author, new.isbn); "
+            "END"
+        ))
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        db.session.execute(text("INSERT INTO search_book_fts(search_book_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+    def apply(self, query, terms):
+        match_terms = []
+        for field, term in terms.items():
+            # The trigram tokenizer cannot match anything shorter than one trigram.
+            if len(term) < self.min_term_length:
+                query = query.filter(getattr(Book, field).ilike(f'%{term}%'))
+            else:
+                escaped_term = term.replace('"', '""')
+                match_terms.append(f'{field} : "{escaped_term}"')
+
+        if not match_terms:
+            return query, None
+
+        matches = text(
+            "SELECT rowid AS book_id, bm25(search_book_fts) AS rank FROM search_book_fts WHERE search_book_fts MATCH :match"
+        ).bindparams(match=' AND '.join(match_terms)).columns(book_id=Integer, rank=Float).subquery()
+
+        query = query.join(matches, matches.c.book_id == Book.id)
+        return query, matches.c.rank
+
+class PostgresSearchProvider(SearchProvider):
+    name = 'postgresql-trigram'
+
+    def ensure_index(self):
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for field in SEARCH_FIELDS:
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS search_book_{field}_trgm ON book USING gin ({field} gin_trgm_ops)"))
+        db.session.commit()
+
+    def rebuild_index(self):
+        for field in SEARCH_FIELDS:
+            db.session.execute(text(f"REINDEX INDEX search_book_{field}_trgm"))
+        db.session.commit()
+
+    def apply(self, query, terms):
+        rank = None
+        for field, term in terms.items():
+            column = getattr(Book, field)
+            query = query.filter(column.ilike(f'%{term}%'))
+            # Lower is better so that the default ascending order lists the closest matches first.
+            similarity = -func.word_similarity(term, column)
+            rank = similarity if rank is None else rank + similarity
+        return query, rank
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def create_search_provider():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return SqliteFtsSearchProvider()
+    if dialect == 'postgresql':
+        return PostgresSearchProvider()
+    return SearchProvider()
+
+def get_search_provider():
+    global _provider
+    if _provider is not None:
+        return _provider
+
+    with _provider_lock:
+        if _provider is None:
+            provider = create_search_provider()
+            try:
+                provider.ensure_index()
+            except SQLAlchemyError:
+                db.session.rollback()
+                app.logger.exception('Could not prepare the %s search index, falling back to LIKE search', provider.name)
+                provider = SearchProvider()
+            _provider = provider
+
+    return _provider
@@ -0,0 +1,256 @@
+import bisect
+import re
+import threading
+from array import array
+import time
+import unicodedata
+
+import numpy as np
+from sqlalchemy import event, func, select
+
+from app import app, db
+from app.models import Book, Borrow
+from app.cache import get_version
+from app.constants import SUGGEST_REFRESH_INTERVAL
+
+WORD_PATTERN = re.compile(r'\w+')
+INDEXED_FIELDS = ('title', 'author', 'isbn')
+# Entries are ordered by at most this many characters, so longer queries are cut to it.
+KEY_LENGTH = 48
+# Ranking prefixes that match more entries than this takes too long for every keystroke, so their results are
+# remembered for the lifetime of the index.
+WIDE_PREFIX_ENTRIES = 1000
+
+def normalize(value):
+    value = (value or '').casefold()
+    if not value.isascii():
+        value = ''.join(character for character in unicodedata.normalize('NFKD', value) if not unicodedata.combining(character))
+    return ' '.join(WORD_PATTERN.findall(value))
+
+def book_fields(title, author, isbn):
+    return [field for field in (normalize(title), normalize(author), normalize(isbn)) if field]
+
+class SuggestIndex:
+    # A word level suffix array: every word of a title, author or ISBN starts one entry, stored as an offset into
+    # a single normalized text and sorted by the text that follows it, so a prefix is one contiguous range.
+    # Offsets stay in an array of C ints so that the binary search reads plain Python ints.
+    def __init__(self, text, offsets, entry_books, popularity, books):
+        self.text = text
+        self.offsets = array('i', offsets)
+        self.entry_books = entry_books
+        self.popularity = popularity
+        self.books = books
+        self.wide_prefixes = {}
+
+    @classmethod
+    def build(cls, books, popularity):
+        fields, field_books = [], []
+        for book_id, title, author, isbn in books:
+            for field in book_fields(title, author, isbn):
+                fields.append(field)
+                field_books.append(book_id)
+
+        # The separator sorts before every character, so an entry never matches past the end of its field.
+        text = ''.join(field + '\0' for field in fields)
+        characters = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        separators = (characters == ord(' ')) | (characters == 0)
+        word_starts = ~separators & np.concatenate(([True], separators[:-1]))
+
+        offsets = sorted(np.flatnonzero(word_starts).tolist(), key=lambda offset: text[offset:offset + KEY_LENGTH])
+        character_books = np.repeat(np.array(field_books, dtype=np.int32), [len(field) + 1 for field in fields])
+        return cls(
+            text,
+            offsets,
+            character_books[np.array(offsets, dtype=np.int64)],
+            popularity,
+            {book_id: (title, author, isbn) for book_id, title, author, isbn in books}
+        )
+
+    def bounds(self, prefix):
+        text, size = self.text, len(prefix)
+        key = lambda offset: text[offset:offset + size]
+        start = bisect.bisect_left(self.offsets, prefix, key=key)
+        return start, bisect.bisect_right(self.offsets, prefix, lo=start, key=key)
+
+    def suggest(self, query, limit):
+        prefix = normalize(query)[:KEY_LENGTH]
+        if not prefix:
+            return []
+
+        suggestions = self.wide_prefixes.get((prefix, limit))
+        if suggestions is not None:
+            return suggestions
+
+        start, end = self.bounds(prefix)
+        suggestions = [self.suggestion(book_id) for book_id in self.rank(self.entry_books[start:end], limit)]
+        if end - start > WIDE_PREFIX_ENTRIES:
+            self.wide_prefixes[prefix, limit] = suggestions
+        return suggestions
+
+    def rank(self, candidates, limit):
+        wanted = limit * 4
+        if len(candidates) <= wanted:
+            # Plain Python is faster than numpy for a handful of entries.
+            popularity = self.popularity
+            return sorted(set(candidates.tolist()), key=lambda book_id: (-popularity[book_id], book_id))[:limit]
+
+        # A book can match with several of its words, so a few more entries than needed are ranked first.
+        best = candidates[np.argpartition(-self.popularity[candidates], wanted - 1)[:wanted]]
+        book_ids = self.unique_by_popularity(best)
+        if len(book_ids) < limit:
+            book_ids = self.unique_by_popularity(np.unique(candidates))
+        return book_ids[:limit]
+
+    def unique_by_popularity(self, candidates):
+        order = np.lexsort((candidates, -self.popularity[candidates]))
+        return list(dict.fromkeys(candidates[order].tolist()))
+
+    def suggestion(self, book_id):
+        title, author, isbn = self.books[book_id]
+        return {'id': book_id, 'title': title, 'author': author, 'isbn': isbn}
+
+    def patched(self, changed_books, deleted_ids):
+        books = {book_id: fields for book_id, fields in self.books.items() if book_id not in deleted_ids}
+        books.update(changed_books)
+        keep = ~np.isin(self.entry_books, list(set(changed_books) | set(deleted_ids)))
+        remaining = SuggestIndex(self.text, np.frombuffer(self.offsets, dtype=np.int32)[keep], self.entry_books[keep], self.popularity, books)
+
+        # Removed entries leave their text behind until the next rebuild, new entries are merged into the sorted order.
+        added = SuggestIndex.build([(book_id, *fields) for book_id, fields in changed_books.items()], self.popularity)
+        positions = [remaining.bounds(added.text[offset:offset + KEY_LENGTH])[0] for offset in added.offsets]
+
+        popularity = self.popularity
+        size = max(changed_books, default=-1) + 1
+        if size > len(popularity):
+            popularity = np.concatenate((popularity, np.zeros(size - len(popularity), dtype=popularity.dtype)))
+
+        return SuggestIndex(
+            self.text + added.text,
+            np.insert(np.frombuffer(remaining.offsets, dtype=np.int32), positions, np.frombuffer(added.offsets, dtype=np.int32) + len(self.text)),
+            np.insert(remaining.entry_books, positions, added.entry_books),
+            popularity,
+            books
+        )
+
+    def add_borrows(self, book_ids):
+        # Wide prefixes keep their ranking until the next rebuild.
+        for book_id in book_ids:
+            if book_id < len(self.popularity):
+                self.popularity[book_id] += 1
+
+class BookSuggestions:
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.version = None
+        self.built_at = 0
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.replayed_patches = []
+
+    def suggest(self, query, limit):
+        return self.get_index().suggest(query, limit)
+
+    def get_index(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index, self.version, self.built_at = self.load()
+        elif self.is_stale():
+            self.rebuild_in_background()
+        return self.index
+
+    def is_stale(self):
+        now = time.monotonic()
+        if now - self.checked_at < 1:
+            return False
+
+        self.checked_at = now
+        # Catalog imports and other bulk changes bypass the ORM events, but bump the books version.
+        return now - self.built_at > self.refresh_interval or get_version('books') != self.version
+
+    def load(self):
+        version = get_version('books')
+        books = db.session.execute(select(Book.id, Book.title, Book.author, Book.isbn)).all()
+        borrow_counts = db.session.execute(
+            select(Borrow.book_id, func.count(Borrow.id)).where(Borrow.book_id != None).group_by(Borrow.book_id)
+        ).all()
+
+        popularity = np.zeros(max((book.id for book in books), default=0) + 1, dtype=np.int32)
+        for book_id, count in borrow_counts:
+            if book_id < len(popularity):
+                popularity[book_id] = count
+
+        return SuggestIndex.build([tuple(book) for book in books], popularity), version, time.monotonic()
+
+    def rebuild_in_background(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.rebuild, name='book-suggestions', daemon=True).start()
+
+    def rebuild(self):
+        try:
+            with app.app_context():
+                index, version, built_at = self.load()
+            with self.lock:
+                # Changes committed while the books were being read would otherwise be lost.
+                for changed_books, deleted_ids in self.replayed_patches:
+                    index = index.patched(changed_books, deleted_ids)
+                self.index, self.version, self.built_at = index, version, built_at
+        except Exception:
+            app.logger.exception('Could not rebuild the book suggestions')
+        finally:
+            with self.lock:
+                self.rebuilding = False
+                self.replayed_patches = []
+
+    def patch(self, changed_books, deleted_ids, borrowed_ids):
+        if self.index is None:
+            return
+
+        with self.lock:
+            if self.index is None:
+                return
+            if changed_books or deleted_ids:
+                self.index = self.index.patched(changed_books, deleted_ids)
+                if self.rebuilding:
+                    self.replayed_patches.append((changed_books, deleted_ids))
+            if borrowed_ids:
+                self.index.add_borrows(borrowed_ids)
+
+book_suggestions = BookSuggestions(SUGGEST_REFRESH_INTERVAL)
+
+@event.listens_for(db.session, 'after_flush')
+def collect_suggestion_changes(session, flush_context):
+    changes = session.info.setdefault('suggestion_changes', ({}, set(), []))
+    changed_books, deleted_ids, borrowed_ids = changes
+
+    for instance in session.new:
+        if isinstance(instance, Book):
+            changed_books[instance.id] = tuple(getattr(instance, field) for field in INDEXED_FIELDS)
+        elif isinstance(instance, Borrow) and instance.book_id is not None:
+            borrowed_ids.append(instance.book_id)
+
+    for instance in session.dirty:
+        if isinstance(instance, Book):
+            state = db.inspect(instance)
+            if any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS):
+                changed_books[instance.id] = tuple(getattr(instance, field) for field in INDEXED_FIELDS)
+
+    for instance in session.deleted:
+        if isinstance(instance, Book):
+            deleted_ids.add(instance.id)
+            changed_books.pop(instance.id, None)
+
+@event.listens_for(db.session, 'after_commit')
+def apply_suggestion_changes(session):
+    changes = session.info.pop('suggestion_changes', None)
+    if changes and any(changes):
+        book_suggestions.patch(*changes)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_suggestion_changes(session):
+    session.info.pop('suggestion_changes', None)
@@ -1,18 +1,173 @@
+import base64
 import hashlib
+import json
 import re
 
-from datetime import datetime
-from sqlalchemy import func
+from datetime import datetime, timedelta
+from flask import g
+from sqlalchemy import and_, case, func, or_, select, update
 
 from app import db
-from app.models import Review
+from app.cache import cache, get_version, invalidate_books, invalidate_all_books, invalidate_user_borrows
+from app.constants import BORROW_SUMMARY_TTL, CACHE_URL
+from app.models import Book, Borrow, Review, Invoice
 
-def get_book_average_rating(book_id):
-    avg_rating = db.session.query(func.avg(Review.rating)).filter(Review.book_id == book_id).scalar()
-    return round(avg_rating, 2) if avg_rating else 0
+CATALOG_SORT_FIELDS = ('title', 'author', 'isbn', 'rental_price', 'total_copies', 'average_rating', 'id', 'rank')
+CATALOG_COMPUTED_FIELDS = ('currently_available', 'average_rating')
+UPCOMING_RETURN_DAYS = 5
+RATING_VALUES = range(1, 6)
+RATING_COUNT_COLUMNS = {rating: getattr(Book, f'rating_{rating}_count') for rating in RATING_VALUES}
+BORROW_STATUS_FILTERS = {
+    'active': and_(Borrow.returned == False, Borrow.payment_status == 'success'),
+    'pending': and_(Borrow.returned == False, Borrow.payment_status == 'pending'),
+    'returned': Borrow.returned == True
+}
 
-def is_book_available(book):
-    return book.total_copies > book.borrows.filter_by(returned=False).count()
+def book_catalog_query(available_only=False):
+    query = db.session.query(
+        Book,
+        Book.available_copies.label('currently_available'),
+        Book.average_rating
+    )
+
+    if available_only:
+        query = query.filter(Book.available_copies > 0)
+
+    return query
+
+def dump_catalog_row(row, book_schema, computed_fields=CATALOG_COMPUTED_FIELDS):
+    book, currently_available, average_rating = row[:3]
+    book_data = book_schema.dump(book)
+    if 'currently_available' in computed_fields:
+        book_data['currently_available'] = currently_available
+    if 'average_rating' in computed_fields:
+        book_data['average_rating'] = round(float(average_rating), 2) if average_rating else 0
+    return book_data
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Malformed cursor')
+
+    if not isinstance(values, list):
+        raise ValueError('Malformed cursor')
+
+    return values
+
+def encode_datetime_cursor(value, last_id):
+    return encode_cursor(value.isoformat() if value else None, last_id)
+
+def decode_datetime_cursor(cursor):
+    last_value, last_id = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(last_value) if last_value is not None else None, last_id
+    except TypeError:
+        raise ValueError('Malformed cursor')
+
+def keyset_order(column, id_column, sort_order):
+    if sort_order == 'asc':
+        return column.asc().nullsfirst(), id_column.asc()
+    return column.desc().nullslast(), id_column.desc()
+
+def keyset_filter(column, id_column, sort_order, last_value, last_id):
+    if sort_order == 'asc':
+        if last_value is None:
+            return or_(and_(column == None, id_column > last_id), column != None)
+        return or_(column > last_value, and_(column == last_value, id_column > last_id))
+
+    if last_value is None:
+        return and_(column == None, id_column < last_id)
+    return or_(column < last_value, and_(column == last_value, id_column < last_id), column == None)
+
+def reserve_book_copy(book_id):
+    result = db.session.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1)
+    )
+    if result.rowcount != 1:
+        return False
+
+    invalidate_books(book_id)
+    return True
+
+def release_book_copy(book_id):
+    db.session.execute(
+        update(Book)
+        .where(Book.id == book_id)
+        .values(available_copies=Book.available_copies + 1)
+    )
+    invalidate_books(book_id)
+
+def mark_borrow_returned(borrow_id, **values):
+    # Only the request that flips the flag may release the copy, concurrent returns and cancellations see rowcount 0.
+    result = db.session.execute(
+        update(Borrow)
+        .where(Borrow.id == borrow_id, Borrow.returned == False)
+        .values(returned=True, **values)
+    )
+    return result.rowcount == 1
+
+def record_book_rating(book_id, rating):
+    rating_column = RATING_COUNT_COLUMNS[rating]
+    db.session.execute(
+        update(Book)
+        .where(Book.id == book_id)
+        .values({
+            Book.rating_sum: Book.rating_sum + rating,
+            Book.rating_count: Book.rating_count + 1,
+            Book.average_rating: (Book.rating_sum + rating) * 1.0 / (Book.rating_count + 1),
+            rating_column: rating_column + 1
+        })
+    )
+    invalidate_books(book_id)
+
+def rating_histogram(book):
+    return {rating: getattr(book, f'rating_{rating}_count') or 0 for rating in RATING_VALUES}
+
+def backfill_review_timestamps():
+    # Reviews can only be written after a return, so the return is the closest known time for old reviews.
+    returned_at = select(func.max(func.coalesce(Borrow.return_date, Borrow.borrow_date))) \
+        .where(Borrow.user_id == Review.user_id, Borrow.book_id == Review.book_id) \
+        .scalar_subquery()
+
+    result = db.session.execute(
+        update(Review).where(Review.timestamp == None).values(timestamp=returned_at).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    invalidate_all_books()
+    return result.rowcount
+
+def rebuild_book_counters(missing_only=False):
+    active_borrows = select(func.count(Borrow.id)) \
+        .where(Borrow.book_id == Book.id, Borrow.returned == False) \
+        .scalar_subquery()
+    rating_sum = select(func.coalesce(func.sum(Review.rating), 0)).where(Review.book_id == Book.id).scalar_subquery()
+    rating_count = select(func.count(Review.id)).where(Review.book_id == Book.id).scalar_subquery()
+
+    rating_counts = {
+        f'rating_{rating}_count': select(func.count(Review.id)).where(Review.book_id == Book.id, Review.rating == rating).scalar_subquery()
+        for rating in RATING_VALUES
+    }
+
+    statement = update(Book).values(
+        available_copies=Book.total_copies - active_borrows,
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        average_rating=case((rating_count > 0, rating_sum * 1.0 / rating_count), else_=0.0),
+        **rating_counts
+    )
+    if missing_only:
+        statement = statement.where((Book.available_copies == None) | (Book.rating_count == None) | (Book.rating_5_count == None))
+
+    result = db.session.execute(statement.execution_options(synchronize_session=False))
+    db.session.commit()
+    invalidate_all_books()
+    return result.rowcount
 
 def is_valid_username(username):
     return len(username) > 0
@@ -20,6 +175,63 @@ def is_valid_username(username):
 def is_valid_password(password):
     return bool(re.match(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)[a-zA-Z\d]{8,}$', password))
 
+def borrow_summary_statement(user_id, now):
+    return select(
+        func.count(Borrow.id),
+        func.count(case((Borrow.return_by_date < now, 1))),
+        func.count(case((and_(Borrow.return_by_date >= now, Borrow.return_by_date <= now + timedelta(days=UPCOMING_RETURN_DAYS)), 1)))
+    ).where(Borrow.user_id == user_id, Borrow.returned == False)
+
+def query_borrow_summary(user_id):
+    active, overdue, upcoming = db.session.execute(borrow_summary_statement(user_id, datetime.utcnow())).one()
+
+    return {'active': active, 'overdue': overdue, 'upcoming': upcoming}
+
+def borrow_summary(user_id):
+    summaries = g.setdefault('borrow_summaries', {})
+    if user_id in summaries:
+        return summaries[user_id]
+
+    summary = None
+    # Without CACHE_URL the version lives in the database, and reading it costs as much as the summary query.
+    if BORROW_SUMMARY_TTL and CACHE_URL:
+        key = f'borrow_summary:{user_id}@{get_version(f"user:{user_id}:borrows")}'
+        summary = cache.get(key)
+        if summary is None:
+            summary = query_borrow_summary(user_id)
+            cache.set(key, summary, ttl=BORROW_SUMMARY_TTL)
+    else:
+        summary = query_borrow_summary(user_id)
+
+    summaries[user_id] = summary
+    return summary
+
+def forget_borrow_summary(user_id):
+    invalidate_user_borrows(user_id)
+    g.get('borrow_summaries', {}).pop(user_id, None)
+
+def apply_payment_status(borrow, status):
+    borrow.payment_status = status
+    forget_borrow_summary(borrow.user_id)
+    if status.lower() != 'success':
+        if mark_borrow_returned(borrow.id):
+            release_book_copy(borrow.book_id)
+    else:
+        # Every borrow of a cart checkout shares the payment, and the payment gets a single invoice.
+        if not find_invoice(borrow):
+            invoice = Invoice(
+                borrow_id=borrow.id,
+                payment_id=borrow.payment_id,
+                payment_date=datetime.utcnow()
+            )
+
+            db.session.add(invoice)
+
+def find_invoice(borrow):
+    if borrow.payment_id:
+        return Invoice.query.filter((Invoice.payment_id == borrow.payment_id) | (Invoice.borrow_id == borrow.id)).first()
+    return Invoice.query.filter_by(borrow_id=borrow.id).first()
+
 def generate_short_numerical_id(user_id, book_id):
     datetime_now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
     
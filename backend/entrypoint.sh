@@ -8,4 +8,8 @@ flask db migrate
 
 flask db upgrade
 
+flask rebuild-book-counters --missing-only
+
+flask backfill-review-timestamps
+
 exec "$@"
\ No newline at end of file
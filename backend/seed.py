@@ -1,18 +1,9 @@
 from app import app, db
-from app.models import Book, Borrow, User, Review, Invoice
-import requests
-
-def get_book_info(isbn):
-    url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-    response = requests.get(url)
-    data = response.json()
-    
-    if 'items' in data:
-        book_info = data['items'][0]['volumeInfo']
-        cover_link = book_info['imageLinks']['thumbnail'] if 'imageLinks' in book_info else 'Cover image not available'
-        
-        return cover_link
-    return None
+from app.models import Book, BookRelation, Borrow, User, Review, Invoice
+from app.constants import COVER_PROVIDER
+from app.catalog_import import import_catalog
+from app.cover_metadata import create_cover_provider, open_cover_cache
+from app.cover_store import store_book_covers
 
 def seed_database():
     
@@ -20,6 +11,7 @@ def seed_database():
         Invoice.query.delete()
         Review.query.delete()
         Borrow.query.delete()
+        BookRelation.query.delete()
         Book.query.delete()
         User.query.delete()
 
@@ -48,18 +40,16 @@ def seed_database():
             'total_copies': 4, 'rental_price': 9.99}
         ]
 
-        for book_data in books_data:
-            book = Book.query.filter_by(isbn=book_data['isbn']).first()
-            if not book:
-                book_cover_src = get_book_info(book_data['isbn'])
-                if book_cover_src is None:
-                    book_cover_src = ''
+        cache = open_cover_cache()
+        try:
+            report = import_catalog(books_data, create_cover_provider(COVER_PROVIDER), cache)
+        finally:
+            cache.close()
 
-                book = Book(title=book_data['title'], author=book_data['author'], isbn=book_data['isbn'], total_copies=book_data['total_copies'], rental_price=book_data['rental_price'], cover_source=book_cover_src)
-                db.session.add(book)
+        print(f'Imported {report.summary()}')
 
-        
-        db.session.commit()
+        stored, failed = store_book_covers()
+        print(f'Stored {stored} covers, {failed} failed')
 
 if __name__ == '__main__':
     seed_database()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+import pytest
+
+database_directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(database_directory, "test.db")}'
+
+from app import app as flask_app, db
+from app.models import Book, Borrow, Review, User
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture(scope='session')
+def books(app):
+    users = [User(username=f'reader{index}', email=f'reader{index}@example.com') for index in range(5)]
+    books = [
+        Book(title=f'Book {index}', author=f'Author {index % 7}', isbn=f'978{index:010d}', total_copies=3, rental_price=1.5 + index)
+        for index in range(40)
+    ]
+    db.session.add_all(users + books)
+    db.session.flush()
+
+    for index, book in enumerate(books):
+        user = users[index % len(users)]
+        db.session.add(Borrow(user_id=user.id, book_id=book.id, returned=index % 2 == 0, payment_status='completed'))
+        db.session.add(Review(user_id=user.id, book_id=book.id, rating=index % 5 + 1, content='Review'))
+        book.available_copies = 0 if index % 4 == 0 else 2
+        book.rating_sum, book.rating_count, book.average_rating = index % 5 + 1, 1, index % 5 + 1
+    db.session.commit()
+    return books
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,59 @@
+from sqlalchemy import update
+
+from app import db
+from app.models import Book, Borrow
+from app.utils import apply_payment_status, mark_borrow_returned, release_book_copy
+
+def create_borrow(book):
+    book.available_copies -= 1
+    borrow = Borrow(user_id=1, book_id=book.id, payment_status='pending')
+    db.session.add(borrow)
+    db.session.commit()
+    return db.session.get(Borrow, borrow.id)
+
+def return_elsewhere(borrow):
+    # Another request returns the borrow while this session still holds it as not returned.
+    with db.engine.begin() as connection:
+        connection.execute(update(Borrow).where(Borrow.id == borrow.id).values(returned=True))
+        connection.execute(update(Book).where(Book.id == borrow.book_id).values(available_copies=Book.available_copies + 1))
+
+def available_copies(book):
+    db.session.expire_all()
+    return db.session.get(Book, book.id).available_copies
+
+def test_a_return_is_released_once(books):
+    book = books[5]
+    copies = book.available_copies
+    borrow = create_borrow(book)
+
+    assert mark_borrow_returned(borrow.id)
+    release_book_copy(book.id)
+    db.session.commit()
+
+    assert not mark_borrow_returned(borrow.id)
+    db.session.commit()
+    assert available_copies(book) == copies
+
+def test_stale_return_does_not_release_again(books):
+    book = books[6]
+    copies = book.available_copies
+    borrow = create_borrow(book)
+    assert not borrow.returned
+
+    return_elsewhere(borrow)
+
+    assert not mark_borrow_returned(borrow.id)
+    db.session.rollback()
+    assert available_copies(book) == copies
+
+def test_stale_cancellation_does_not_release_again(books):
+    book = books[7]
+    copies = book.available_copies
+    borrow = create_borrow(book)
+    assert not borrow.returned
+
+    return_elsewhere(borrow)
+    apply_payment_status(borrow, 'canceled')
+    db.session.commit()
+
+    assert available_copies(book) == copies
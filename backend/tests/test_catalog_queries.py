@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+
+@contextmanager
+def recorded_statements():
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        # Cache version lookups are the same for every page and are not part of the catalog queries.
+        if 'cache_version' not in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+def count_statements(client, url):
+    with recorded_statements() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return response, len(statements)
+
+@pytest.mark.parametrize('query_string, matching_books', [('', 40), ('&isAvailable=true', 30)])
+def test_catalog_query_count_does_not_depend_on_page_size(client, books, query_string, matching_books):
+    counts = {}
+    for limit in (1, 10, 40):
+        response, counts[limit] = count_statements(client, f'/books?limit={limit}{query_string}')
+        assert len(response.get_json()) == min(limit, matching_books)
+
+    assert set(counts.values()) == {1}
+
+def test_full_catalog_is_one_query(client, books):
+    response, count = count_statements(client, '/books?sortField=author')
+
+    assert len(response.get_json()) == len(books)
+    assert count == 1
+
+def test_book_details_are_one_query(client, books):
+    book = books[3]
+    response, count = count_statements(client, f'/books/{book.id}')
+
+    book_data = response.get_json()
+    assert book_data['currently_available'] == 2
+    assert book_data['average_rating'] == 4
+    assert count == 1
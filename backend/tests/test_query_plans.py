@@ -0,0 +1,34 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from app import db
+from app.models import Book
+from app.query_plans import check_query_plans, sqlite_plan
+
+# The Postgres plans are only checked against a scratch database given here, e.g. postgresql://localhost/biblioconnect_test.
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+def test_hot_queries_do_not_scan_whole_tables(app):
+    full_scans = {name: details for name, details, scans in check_query_plans() if scans}
+
+    assert full_scans == {}
+
+def test_unindexed_query_is_reported_as_full_scan(app):
+    with db.engine.connect() as connection:
+        details, full_scans = sqlite_plan(connection, select(Book).where(Book.rental_price > 1))
+
+    assert full_scans == details
+
+@pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+def test_hot_queries_do_not_scan_whole_tables_on_postgres(app):
+    engine = create_engine(POSTGRES_URL)
+    db.metadata.create_all(engine)
+    try:
+        full_scans = {name: details for name, details, scans in check_query_plans(engine) if scans}
+    finally:
+        db.metadata.drop_all(engine)
+        engine.dispose()
+
+    assert full_scans == {}
@@ -0,0 +1,112 @@
+import argparse
+import importlib.util
+import os
+import timeit
+import uuid
+import warnings
+from datetime import datetime
+
+from pydifact.segmentcollection import Interchange
+from pydifact.segments import Segment
+
+warnings.filterwarnings('ignore')
+
+EDIFACT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'app', 'edifact.py')
+
+def load_codec():
+    # Loaded by path so that the benchmark does not need the Flask app or a database.
+    spec = importlib.util.spec_from_file_location('edifact', EDIFACT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+edifact = load_codec()
+
+TIMESTAMP = datetime(2024, 1, 1, 12, 0)
+TITLE = "Harry Potter and the Philosopher's Stone: Illustrated Edition"
+CALLBACK_URL = 'http://backend:5000/update_payment_status'
+
+def pydifact_borrowing_request():
+    message = Interchange("BiblioConnectAPI", "PaymentMock", "12345678", ("UNOC", 3), timestamp=TIMESTAMP)
+    message.add_segment(Segment("BGM", ["351", "Borrowing"]))
+    message.add_segment(Segment("DTM", ["137", TIMESTAMP.strftime("%Y%m%d"), "102"]))
+    message.add_segment(Segment("NAD", ["BY", "42"]))
+    message.add_segment(Segment("NAD", ["SU", "7"]))
+    message.add_segment(Segment("FTX", ["AAI", "Book Title", TITLE]))
+    message.add_segment(Segment("MOA", ["ZZZ", "Amount", "12.5"]))
+    message.add_segment(Segment("COM", ["Callback URL", CALLBACK_URL]))
+    return message.serialize()
+
+def codec_borrowing_request():
+    return edifact.encode_borrowing_request(12345678, edifact.BorrowingRequest(42, [edifact.BorrowingLine(7, TITLE, 12.5)], CALLBACK_URL), TIMESTAMP)
+
+def pydifact_statuses(statuses):
+    message = Interchange("PaymentMock", "Service", "12345678", ("UNOC", 3), timestamp=TIMESTAMP)
+    message.add_segment(Segment("BGM", ["353", "Payment Status"]))
+    message.add_segment(Segment("DTM", ["137", TIMESTAMP.strftime("%Y%m%d"), "102"]))
+    for payment_id, status in statuses:
+        message.add_segment(Segment("STS", [status]))
+        message.add_segment(Segment("PID", ["", "", payment_id]))
+    return message.serialize()
+
+def codec_statuses(statuses):
+    return edifact.encode_payment_statuses(12345678, statuses, TIMESTAMP)
+
+def pydifact_decode_borrowing_request(message):
+    values = {}
+    for segment in Interchange.from_str(message).segments:
+        if segment.tag == 'FTX' and segment.elements[0][0] == 'AAI':
+            values['title'] = segment.elements[0][2]
+        elif segment.tag == 'MOA' and segment.elements[0][0] == 'ZZZ':
+            values['amount'] = segment.elements[0][2]
+        elif segment.tag == 'COM' and segment.elements[0][0] == 'Callback URL':
+            values['callback_url'] = segment.elements[0][1]
+    return values
+
+def pydifact_decode_statuses(message):
+    statuses = {}
+    status = None
+    for segment in Interchange.from_str(message).segments:
+        if segment.tag == 'STS':
+            status = segment.elements[0]
+        elif segment.tag == 'PID' and status:
+            statuses[segment.elements[0][2]] = status
+            status = None
+    return statuses
+
+def measure(function, seconds):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    repeats = max(1, int(seconds / max(timer.timeit(number), 1e-9)))
+    best = min(timer.repeat(repeat=min(repeats, 5), number=number))
+    return number / best
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the BiblioConnect EDIFACT codec with pydifact.')
+    parser.add_argument('--statuses', type=int, default=100, help='Number of STS/PID pairs in the bulk status message.')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Rough time budget per measurement.')
+    args = parser.parse_args()
+
+    statuses = [(str(uuid.uuid4()), 'success' if index % 3 else 'pending') for index in range(args.statuses)]
+    borrowing_message = pydifact_borrowing_request()
+    status_message = pydifact_statuses(statuses)
+
+    assert codec_borrowing_request() == borrowing_message
+    assert codec_statuses(statuses) == status_message
+    assert edifact.decode_payment_statuses(status_message) == pydifact_decode_statuses(status_message)
+
+    cases = (
+        ('serialize borrowing request', pydifact_borrowing_request, codec_borrowing_request),
+        ('parse borrowing request', lambda: pydifact_decode_borrowing_request(borrowing_message), lambda: edifact.decode_borrowing_request(borrowing_message)),
+        (f'serialize {args.statuses} statuses', lambda: pydifact_statuses(statuses), lambda: codec_statuses(statuses)),
+        (f'parse {args.statuses} statuses', lambda: pydifact_decode_statuses(status_message), lambda: edifact.decode_payment_statuses(status_message)),
+    )
+
+    print(f'{"case":<32}{"pydifact ops/s":>16}{"codec ops/s":>16}{"speedup":>10}')
+    for name, baseline, candidate in cases:
+        baseline_rate = measure(baseline, args.seconds)
+        candidate_rate = measure(candidate, args.seconds)
+        print(f'{name:<32}{baseline_rate:>16,.0f}{candidate_rate:>16,.0f}{candidate_rate / baseline_rate:>9.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCHMARKS_DIR, '..', 'backend')
+DEFAULT_DATABASE_URL = f'sqlite:///{os.path.join(BENCHMARKS_DIR, "data", "backend.db")}'
+
+BENCHMARK_PASSWORD = 'Benchmark1'
+BORROW_DAYS = 14
+
+TITLE_ADJECTIVES = ('Silent', 'Hidden', 'Last', 'Broken', 'Golden', 'Northern', 'Forgotten', 'Crimson', 'Endless', 'Quiet', 'Wild', 'Distant', 'Burning', 'Frozen', 'Secret', 'Little')
+TITLE_NOUNS = ('River', 'Garden', 'Kingdom', 'Letter', 'Winter', 'Harbor', 'Mountain', 'Archive', 'Forest', 'Station', 'Island', 'Library', 'Orchard', 'Empire', 'Lighthouse', 'Voyage')
+TITLE_PLACES = ('Krakow', 'Lisbon', 'the North', 'the Valley', 'Avalon', 'the City', 'the Steppe', 'Gdansk', 'the Coast', 'Prague', 'the Marsh', 'Vienna')
+FIRST_NAMES = ('Anna', 'Piotr', 'Maria', 'Jan', 'Olga', 'Tomasz', 'Ewa', 'Adam', 'Clara', 'Henry', 'Ines', 'Lukas', 'Mira', 'Oscar', 'Rosa', 'Victor')
+LAST_NAMES = ('Nowak', 'Kowalska', 'Wright', 'Lindqvist', 'Moreau', 'Costa', 'Novak', 'Fischer', 'Okafor', 'Tanaka', 'Silva', 'Brennan', 'Horvat', 'Keller', 'Duarte', 'Varga')
+REVIEW_PHRASES = ('A gripping read.', 'Slow start, strong ending.', 'Beautifully written.', 'Not for me.', 'Would borrow again.', 'The characters felt real.', 'Too long by half.', 'An instant favourite.')
+
+def book_rows(count, rng):
+    for index in range(count):
+        yield {
+            'title': f'The {rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)} of {rng.choice(TITLE_PLACES)} {index}',
+            'author': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'isbn': f'979{index:010d}',
+            'total_copies': rng.randint(1, 5),
+            'rental_price': round(rng.uniform(2, 25), 2),
+            'cover_source': ''
+        }
+
+def user_rows(count, password_hash):
+    for index in range(count):
+        yield {'username': f'bench{index}', 'email': f'bench{index}@example.com', 'password_hash': password_hash, 'is_active': True}
+
+def borrow_rows(count, users, copies, active_ratio, now, rng, active_copies):
+    # Active borrows are due in the future so that the generated users can still borrow during a load test.
+    active_pairs = set()
+    for _ in range(count):
+        user_id = rng.randint(1, users)
+        book_id = rng.randint(1, len(copies))
+        borrow_date = now - timedelta(days=rng.uniform(0, 365))
+        row = {
+            'user_id': user_id,
+            'book_id': book_id,
+            'payment_status': 'success',
+            'payment_id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'payment_url': None,
+            'payment_checked_at': None
+        }
+
+        if rng.random() < active_ratio and active_copies.get(book_id, 0) < copies[book_id - 1] and (user_id, book_id) not in active_pairs:
+            active_copies[book_id] = active_copies.get(book_id, 0) + 1
+            active_pairs.add((user_id, book_id))
+            borrow_date = now - timedelta(days=rng.uniform(0, BORROW_DAYS - 1))
+            row.update(borrow_date=borrow_date, return_by_date=now + timedelta(days=rng.randint(1, BORROW_DAYS)), return_date=None, returned=False)
+        else:
+            if rng.random() < 0.05:
+                row['payment_status'] = 'canceled'
+            row.update(borrow_date=borrow_date, return_by_date=borrow_date + timedelta(days=BORROW_DAYS), return_date=borrow_date + timedelta(days=rng.uniform(0, BORROW_DAYS)), returned=True)
+        yield row
+
+def review_rows(count, users, books, now, rng, ratings):
+    count = min(count, users * books)
+    seen = set()
+    while len(seen) < count:
+        pair = (rng.randint(1, books), rng.randint(1, users))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        rating = rng.choices((1, 2, 3, 4, 5), weights=(1, 2, 4, 6, 5))[0]
+        ratings.setdefault(pair[0], [0] * 5)[rating - 1] += 1
+        yield {
+            'book_id': pair[0],
+            'user_id': pair[1],
+            'rating': rating,
+            'content': rng.choice(REVIEW_PHRASES),
+            'timestamp': now - timedelta(days=rng.uniform(0, 365))
+        }
+
+def counter_rows(copies, active_copies, ratings):
+    # Same values as rebuild_book_counters, computed from the generated rows instead of one correlated subquery per book.
+    for book_id, total_copies in enumerate(copies, start=1):
+        counts = ratings.get(book_id, [0] * 5)
+        rating_count = sum(counts)
+        rating_sum = sum(rating * count for rating, count in enumerate(counts, start=1))
+        row = {
+            'id': book_id,
+            'available_copies': total_copies - active_copies.get(book_id, 0),
+            'rating_sum': rating_sum,
+            'rating_count': rating_count,
+            'average_rating': rating_sum / rating_count if rating_count else 0.0
+        }
+        row.update((f'rating_{rating}_count', count) for rating, count in enumerate(counts, start=1))
+        yield row
+
+def write_batches(db, statement, rows, batch_size):
+    written = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        db.session.execute(statement, batch)
+        db.session.commit()
+        written += len(batch)
+
+def generate(args):
+    os.makedirs(os.path.join(BENCHMARKS_DIR, 'data'), exist_ok=True)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    sys.path.insert(0, BACKEND_DIR)
+
+    from sqlalchemy import insert, text, update
+
+    from app import app, db
+    from app.models import Book, Borrow, Invoice, Review, User
+    from app.passwords import hash_password
+    from app.search import get_search_provider
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            if db.engine.dialect.name == 'sqlite':
+                db.session.execute(text('DROP TABLE IF EXISTS search_book_fts'))
+                db.session.commit()
+        db.create_all()
+
+        if db.session.query(Book.id).first():
+            sys.exit(f'{args.database_url} already contains books, pass --reset to replace them')
+
+        counts = {}
+        active_copies = {}
+        ratings = {}
+        started_at = time.perf_counter()
+        books = list(book_rows(args.books, rng))
+        copies = [book['total_copies'] for book in books]
+        counts['books'] = write_batches(db, insert(Book), books, args.batch_size)
+        counts['users'] = write_batches(db, insert(User), user_rows(args.users, hash_password(BENCHMARK_PASSWORD)), args.batch_size)
+
+        borrows = borrow_rows(args.borrows, args.users, copies, args.active_ratio, now, rng, active_copies)
+        counts['borrows'] = write_batches(db, insert(Borrow), borrows, args.batch_size)
+        invoices = db.session.execute(
+            db.select(Borrow.id, Borrow.payment_id, Borrow.borrow_date).where(Borrow.payment_status == 'success')
+        ).all()
+        counts['invoices'] = write_batches(db, insert(Invoice), ({'borrow_id': borrow_id, 'payment_id': payment_id, 'payment_date': borrow_date} for borrow_id, payment_id, borrow_date in invoices), args.batch_size)
+        counts['reviews'] = write_batches(db, insert(Review), review_rows(args.reviews, args.users, args.books, now, rng, ratings), args.batch_size)
+
+        write_batches(db, update(Book), counter_rows(copies, active_copies, ratings), args.batch_size)
+        get_search_provider()
+        elapsed = time.perf_counter() - started_at
+
+    rows = sum(counts.values())
+    print(', '.join(f'{count} {name}' for name, count in counts.items()))
+    print(f'Generated {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s) into {args.database_url}')
+    print(f'Users are named bench0..bench{args.users - 1} with the password {BENCHMARK_PASSWORD}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a backend database with a synthetic catalog, users, borrows and reviews.')
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL, help='SQLAlchemy URL of the backend database.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--borrows', type=int, default=50000)
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--active-ratio', type=float, default=0.05, help='Share of borrows that are still out.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate the tables first.')
+    generate(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from generate_data import BACKEND_DIR, BENCHMARKS_DIR, BENCHMARK_PASSWORD, DEFAULT_DATABASE_URL, LAST_NAMES, TITLE_ADJECTIVES, TITLE_NOUNS
+from report import format_comparison, format_report, load_report, summarize
+
+PAYMENT_DIR = os.path.join(BENCHMARKS_DIR, '..', 'payment-mockup')
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+DEFAULT_PAYMENT_DATABASE_URL = f'sqlite:///{os.path.join(DATA_DIR, "payment.db")}'
+DEFAULT_MIX = 'catalog=40,search=25,authorize=25,borrow=10'
+
+CATALOG_SORT_FIELDS = ('title', 'rental_price', 'average_rating')
+CALLBACK_TIMEOUT = 10
+CALLBACK_POLL_INTERVAL = 0.02
+
+# Tokens carry the integer user id as their subject, which newer flask_jwt_extended releases only accept with this switched off.
+BACKEND_SERVER = '''
+import sys
+from app import app
+app.config['JWT_VERIFY_SUB'] = False
+app.run(port=int(sys.argv[1]), threaded=True)
+'''
+
+PAYMENT_SCHEMA = '''
+from app import create_app, db
+app = create_app()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+'''
+
+PAYMENT_SERVER = '''
+import sys
+from app import create_app
+create_app().run(port=int(sys.argv[1]), threaded=True)
+'''
+
+SQL_METRIC = re.compile(r'^http_request_sql_(statements|duration_seconds)_(sum|count)\{endpoint="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+class Service:
+    def __init__(self, name, directory, port, environment):
+        self.name = name
+        self.directory = directory
+        self.port = port
+        self.url = f'http://127.0.0.1:{port}'
+        self.environment = dict(os.environ, **environment)
+        self.log_path = os.path.join(DATA_DIR, f'{name}.log')
+        self.process = None
+
+    def run(self, script, *args):
+        subprocess.run([sys.executable, '-c', script, *args], cwd=self.directory, env=dict(self.environment, PAYMENT_SCHEDULER_ENABLED='0'), check=True)
+
+    def start(self, script):
+        log = open(self.log_path, 'w')
+        self.process = subprocess.Popen([sys.executable, '-c', script, str(self.port)], cwd=self.directory, env=self.environment, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if requests.get(f'{self.url}/metrics', timeout=1).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+
+        self.stop()
+        sys.exit(f'{self.name} did not start, see {self.log_path}')
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(10)
+
+class Worker(threading.Thread):
+    def __init__(self, index, context, deadline, measure_from):
+        super().__init__(daemon=True)
+        self.rng = random.Random(context['seed'] + index)
+        self.context = context
+        self.deadline = deadline
+        self.measure_from = measure_from
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {context["tokens"][index]}'
+        self.latencies = {}
+        self.rejected = {}
+        self.errors = {}
+
+    def record(self, operation, started_at, response):
+        finished_at = time.monotonic()
+        if started_at < self.measure_from:
+            return
+        self.latencies.setdefault(operation, []).append(finished_at - started_at)
+        if response is None or response.status_code >= 500:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        elif response.status_code >= 400:
+            self.rejected[operation] = self.rejected.get(operation, 0) + 1
+
+    def call(self, operation, method, url, **kwargs):
+        started_at = time.monotonic()
+        try:
+            response = self.session.request(method, url, timeout=30, **kwargs)
+        except requests.RequestException:
+            response = None
+        self.record(operation, started_at, response)
+        return response
+
+    def random_book(self):
+        return self.rng.randint(1, self.context['books'])
+
+    def catalog(self):
+        backend = self.context['backend_url']
+        params = {'limit': 20, 'sortField': self.rng.choice(CATALOG_SORT_FIELDS), 'sortOrder': self.rng.choice(('asc', 'desc'))}
+        response = self.call('GET /books', 'GET', f'{backend}/books', params=params)
+        if response is not None and response.headers.get('X-Next-Cursor'):
+            self.call('GET /books next page', 'GET', f'{backend}/books', params=dict(params, cursor=response.headers['X-Next-Cursor']))
+
+        book_id = self.random_book()
+        self.call('GET /books/<id>', 'GET', f'{backend}/books/{book_id}')
+        self.call('GET /books/<id>/reviews', 'GET', f'{backend}/books/{book_id}/reviews', params={'limit': 10})
+
+    def search(self):
+        if self.rng.random() < 0.2:
+            params = {'author': self.rng.choice(LAST_NAMES)}
+        else:
+            params = {'query': f'{self.rng.choice(TITLE_ADJECTIVES)} {self.rng.choice(TITLE_NOUNS)}', 'sortField': 'rank'}
+        self.call('GET /books search', 'GET', f'{self.context["backend_url"]}/books', params=dict(params, limit=20))
+
+    def authorize(self):
+        backend = self.context['backend_url']
+        self.call('GET /authorize', 'GET', f'{backend}/authorize')
+        self.call('GET /user/borrows', 'GET', f'{backend}/user/borrows', params={'limit': 20})
+
+    def borrow(self):
+        backend = self.context['backend_url']
+        response = self.call('POST /borrow/<id>', 'POST', f'{backend}/borrow/{self.random_book()}')
+        if response is None or response.status_code != 200:
+            return
+
+        checkout = response.json()
+        borrow_id = checkout['borrow_ids'][0]
+        payment_id = checkout['payment_url'].rsplit('/', 1)[1]
+        paid_at = time.monotonic()
+        response = self.call('POST /process_payment', 'POST', f'{self.context["payment_url"]}/process_payment/{payment_id}', data={'action': 'pay'}, allow_redirects=False)
+
+        if response is not None and response.status_code == 302:
+            # The mockup confirms the payment through its callback outbox, so this is the time until the backend sees it.
+            while time.monotonic() - paid_at < CALLBACK_TIMEOUT:
+                borrow = self.session.get(f'{backend}/borrow/info/{borrow_id}', timeout=30).json()
+                if borrow['payment_status'] != 'pending':
+                    break
+                time.sleep(CALLBACK_POLL_INTERVAL)
+            self.record('payment callback', paid_at, None if borrow['payment_status'] == 'pending' else response)
+
+        self.call('POST /return/<id>', 'POST', f'{backend}/return/{borrow_id}')
+
+    def run(self):
+        scenarios, weights = zip(*self.context['mix'].items())
+        while time.monotonic() < self.deadline:
+            getattr(self, self.rng.choices(scenarios, weights)[0])()
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ('catalog', 'search', 'authorize', 'borrow'):
+            raise argparse.ArgumentTypeError(f'Unknown scenario {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def sql_metrics(backend_url):
+    values = {}
+    for metric, kind, endpoint, value in SQL_METRIC.findall(requests.get(f'{backend_url}/metrics', timeout=10).text):
+        values[(metric, kind, endpoint)] = float(value)
+    return values
+
+def sql_per_request(before, after):
+    result = {}
+    for (metric, kind, endpoint), value in after.items():
+        if metric != 'statements' or kind != 'count' or endpoint == 'metrics':
+            continue
+        requests_made = value - before.get((metric, kind, endpoint), 0)
+        if requests_made <= 0:
+            continue
+        statements = after[('statements', 'sum', endpoint)] - before.get(('statements', 'sum', endpoint), 0)
+        seconds = after[('duration_seconds', 'sum', endpoint)] - before.get(('duration_seconds', 'sum', endpoint), 0)
+        result[endpoint] = (statements / requests_made, seconds / requests_made * 1000)
+    return result
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def log_in(backend_url, users):
+    tokens = []
+    for index in range(users):
+        response = requests.post(f'{backend_url}/login', json={'username': f'bench{index}', 'password': BENCHMARK_PASSWORD}, timeout=30)
+        if response.status_code != 200:
+            sys.exit(f'Could not log in as bench{index}, generate the data with generate_data.py first')
+        tokens.append(response.json()['access_token'])
+    return tokens
+
+def run_load(args, backend_url, payment_url):
+    books = requests.get(f'{backend_url}/books', params={'limit': 1, 'sortField': 'id', 'sortOrder': 'desc', 'fields': 'id'}, timeout=30).json()
+    if not books:
+        sys.exit('The backend has no books, generate the data with generate_data.py first')
+
+    # Every worker has its own user, since one user's pending borrow would block the borrows of the others.
+    context = {
+        'backend_url': backend_url,
+        'payment_url': payment_url,
+        'books': books[0]['id'],
+        'mix': args.mix,
+        'seed': args.seed,
+        'tokens': log_in(backend_url, args.concurrency)
+    }
+
+    started_at = time.monotonic()
+    measure_from = started_at + args.warmup
+    deadline = measure_from + args.duration
+    workers = [Worker(index, context, deadline, measure_from) for index in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(args.warmup)
+    metrics_before = sql_metrics(backend_url)
+    for worker in workers:
+        worker.join()
+    metrics_after = sql_metrics(backend_url)
+
+    operations = {}
+    for name in sorted({name for worker in workers for name in worker.latencies}):
+        operations[name] = summarize(
+            [latency for worker in workers for latency in worker.latencies.get(name, ())],
+            sum(worker.rejected.get(name, 0) for worker in workers),
+            sum(worker.errors.get(name, 0) for worker in workers),
+            args.duration
+        )
+
+    return {
+        'commit': current_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'duration': args.duration,
+        'concurrency': args.concurrency,
+        'mix': ','.join(f'{name}={weight:g}' for name, weight in args.mix.items()),
+        'database': 'external' if args.backend_url else args.database_url.split(':', 1)[0],
+        'operations': operations,
+        'sql_per_request': sql_per_request(metrics_before, metrics_after)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive a request mix through the backend and the payment mockup and report latency percentiles.')
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL, help='Backend database filled by generate_data.py.')
+    parser.add_argument('--payment-database-url', default=DEFAULT_PAYMENT_DATABASE_URL, help='Payment mockup database, recreated on every run.')
+    parser.add_argument('--backend-url', help='Use an already running backend instead of starting one.')
+    parser.add_argument('--payment-url', help='Public URL of the payment mockup that backend talks to, required with --backend-url.')
+    parser.add_argument('--backend-port', type=int, default=5100)
+    parser.add_argument('--payment-port', type=int, default=5101)
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds.')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of load before measuring.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel clients, each logged in as its own user.')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Scenario weights, default {DEFAULT_MIX}.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Report path, by default results/<time>-<commit>.json.')
+    parser.add_argument('--baseline', help='Report of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    if args.backend_url and not args.payment_url:
+        parser.error('--payment-url is required with --backend-url')
+
+    services = []
+    try:
+        if args.backend_url:
+            backend_url, payment_url = args.backend_url.rstrip('/'), args.payment_url.rstrip('/')
+        else:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            payment = Service('payment', PAYMENT_DIR, args.payment_port, {
+                'DATABASE_URL': args.payment_database_url,
+                'PUBLIC_HOSTNAME': f'127.0.0.1:{args.payment_port}',
+                'OUTBOX_INTERVAL': '0.05'
+            })
+            backend = Service('backend', BACKEND_DIR, args.backend_port, {
+                'DATABASE_URL': args.database_url,
+                'PUBLIC_HOSTNAME': f'127.0.0.1:{args.backend_port}',
+                'PAYMENT_HOSTNAME': f'127.0.0.1:{args.payment_port}'
+            })
+            payment.run(PAYMENT_SCHEMA)
+            for service, script in ((payment, PAYMENT_SERVER), (backend, BACKEND_SERVER)):
+                service.start(script)
+                services.append(service)
+            backend_url, payment_url = backend.url, payment.url
+
+        report = run_load(args, backend_url, payment_url)
+    finally:
+        for service in reversed(services):
+            service.stop()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f'{datetime.utcnow():%Y%m%d-%H%M%S}-{report["commit"] or "unknown"}.json')
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(format_report(report))
+    if args.baseline:
+        print()
+        print(format_comparison(report, load_report(args.baseline)))
+    print(f'\nSaved the report to {output}')
+
+if __name__ == '__main__':
+    main()
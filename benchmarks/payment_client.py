@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generate_data import BACKEND_DIR
+from report import summarize
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app.http_client import HttpClient
+from app.async_http_client import AsyncHttpClient
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency, connections):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.latency = latency
+        self.connections = connections
+
+    def process_request(self, request, client_address):
+        with self.connections.get_lock():
+            self.connections.value += 1
+        super().process_request(request, client_address)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        body = b'{"edi": "", "payment_url": ""}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_stand_in(latency, connections, ports):
+    server = StandIn(latency, connections)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+def client_options(args):
+    return {
+        'pool_size': args.pool_size,
+        'connect_timeout': 3,
+        'read_timeout': 10,
+        'max_retries': 0,
+        'retry_backoff': 0,
+        'breaker_threshold': 1000,
+        'breaker_reset': 1
+    }
+
+def timed(latencies, call):
+    started_at = time.perf_counter()
+    call()
+    latencies.append(time.perf_counter() - started_at)
+
+def request_threads(post, args):
+    # Models one backend worker whose request threads each wait on a borrow round trip.
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    def run():
+        while time.perf_counter() < deadline:
+            timed(latencies, post)
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+def fan_out_sequential(post, args):
+    latencies = []
+    for _ in range(args.calls):
+        timed(latencies, post)
+    return latencies
+
+def fan_out_threads(post, args):
+    latencies = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda _: timed(latencies, post), range(args.calls)))
+    return latencies
+
+def fan_out_async(client, url, args):
+    latencies = []
+
+    async def call(semaphore):
+        async with semaphore:
+            started_at = time.perf_counter()
+            await client.request_async('POST', url, data='UNA', idempotent=True)
+            latencies.append(time.perf_counter() - started_at)
+
+    async def gather():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        await asyncio.gather(*(call(semaphore) for _ in range(args.calls)))
+
+    client.run(gather())
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the blocking and the async payment client against a stand-in payment service with fixed latency.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stand-in takes to answer.')
+    parser.add_argument('--threads', type=int, default=16, help='Request threads of the simulated backend worker.')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration of each request thread run.')
+    parser.add_argument('--calls', type=int, default=400, help='Calls per fan-out run, like one reconciliation pass.')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent calls of a fan-out run.')
+    parser.add_argument('--pool-size', type=int, default=20)
+    args = parser.parse_args()
+
+    # The stand-in runs in its own process so that it does not compete with the clients for the GIL.
+    connections, ports = multiprocessing.Value('i', 0), multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_stand_in, args=(args.latency, connections, ports), daemon=True)
+    server.start()
+    url = f'http://127.0.0.1:{ports.get(timeout=10)}/initiate_payment'
+
+    sync_client = HttpClient('bench_sync', **client_options(args))
+    async_client = AsyncHttpClient('bench_async', max_concurrency=args.concurrency, **client_options(args))
+    sync_post = lambda: sync_client.post(url, data='UNA')
+    async_post = lambda: async_client.post(url, data='UNA')
+
+    runs = (
+        (f'borrows, {args.threads} threads, blocking client', lambda: request_threads(sync_post, args), args.seconds),
+        (f'borrows, {args.threads} threads, async client', lambda: request_threads(async_post, args), args.seconds),
+        (f'fan-out of {args.calls}, sequential', lambda: fan_out_sequential(sync_post, args), None),
+        (f'fan-out of {args.calls}, {args.concurrency} threads', lambda: fan_out_threads(sync_post, args), None),
+        (f'fan-out of {args.calls}, async x{args.concurrency}', lambda: fan_out_async(async_client, url, args), None)
+    )
+
+    print(f'Stand-in latency {args.latency * 1000:.0f}ms, client pool size {args.pool_size}')
+    print(f'{"run":<42}{"calls":>8}{"calls/s":>10}{"p50_ms":>10}{"p99_ms":>10}{"connections":>13}')
+    for name, run, duration in runs:
+        opened = connections.value
+        started_at = time.perf_counter()
+        latencies = run()
+        summary = summarize(latencies, 0, 0, duration or time.perf_counter() - started_at)
+        print(f'{name:<42}{summary["requests"]:>8}{summary["throughput"]:>10.1f}{summary["p50_ms"]:>10.1f}{summary["p99_ms"]:>10.1f}{connections.value - opened:>13}')
+
+    async_client.close()
+    server.terminate()
+
+if __name__ == '__main__':
+    main()
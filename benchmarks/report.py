@@ -0,0 +1,81 @@
+import argparse
+import json
+import math
+
+PERCENTILES = (50, 90, 95, 99)
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies, rejected, errors, duration):
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'rejected': rejected,
+        'errors': errors,
+        'throughput': len(latencies) / duration if duration else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0
+    }
+    for percent in PERCENTILES:
+        summary[f'p{percent}_ms'] = percentile(latencies, percent) * 1000
+    return summary
+
+def format_report(report):
+    columns = ('requests', 'rejected', 'errors', 'throughput') + tuple(f'p{percent}_ms' for percent in PERCENTILES) + ('max_ms',)
+    width = max(len(name) for name in report['operations']) + 2
+    lines = [
+        f'{report["commit"] or "unknown commit"}, {report["duration"]:.0f}s at concurrency {report["concurrency"]}, mix {report["mix"]}',
+        'operation'.ljust(width) + ''.join(f'{column:>12}' for column in columns)
+    ]
+    for name, summary in report['operations'].items():
+        lines.append(name.ljust(width) + ''.join(f'{summary[column]:>12.1f}' if isinstance(summary[column], float) else f'{summary[column]:>12}' for column in columns))
+
+    if report.get('sql_per_request'):
+        lines.append('')
+        lines.append('endpoint'.ljust(width) + f'{"sql/request":>12}{"sql ms/req":>12}')
+        for endpoint, (statements, sql_ms) in sorted(report['sql_per_request'].items()):
+            lines.append(endpoint.ljust(width) + f'{statements:>12.1f}{sql_ms:>12.2f}')
+    return '\n'.join(lines)
+
+def relative_change(value, baseline):
+    if not baseline:
+        return '       n/a'
+    return f'{(value - baseline) / baseline * 100:>+9.1f}%'
+
+def format_comparison(report, baseline):
+    columns = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+    width = max(len(name) for name in report['operations']) + 2
+    lines = [
+        f'{report["commit"] or "unknown commit"} against {baseline["commit"] or "unknown commit"}',
+        'operation'.ljust(width) + ''.join(f'{column:>11}' for column in columns)
+    ]
+    for name, summary in report['operations'].items():
+        previous = baseline['operations'].get(name)
+        if previous is None:
+            lines.append(name.ljust(width) + '  not in the baseline')
+            continue
+        lines.append(name.ljust(width) + ' '.join(relative_change(summary[column], previous[column]) for column in columns))
+    return '\n'.join(lines)
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Print a load test report, optionally compared with a baseline report.')
+    parser.add_argument('report')
+    parser.add_argument('--baseline', help='Report of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    report = load_report(args.report)
+    print(format_report(report))
+    if args.baseline:
+        print()
+        print(format_comparison(report, load_report(args.baseline)))
+
+if __name__ == '__main__':
+    main()
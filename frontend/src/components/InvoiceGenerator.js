@@ -19,11 +19,10 @@ const InvoiceGenerator = () => {
         const fetchAndDisplayInvoice = async () => {
             try {
                 const invoiceResponse = await InvoiceService.getInvoice(borrowId);
-                const { id, seller, NIP, payment_date, price, user, book } = invoiceResponse.data;
+                const { id, seller, NIP, payment_date, price, user, book, items } = invoiceResponse.data;
 
                 const VAT_RATE = 0.23;
-                const netPrice = price / (1 + VAT_RATE);
-                const vatAmount = price - netPrice;
+                const invoiceItems = items || [{ title: book.title, author: book.author, price }];
 
                 const doc = new jsPDF();
                 doc.setFont('Lato-Regular');
@@ -47,9 +46,11 @@ const InvoiceGenerator = () => {
                     },
                     columnStyles: { 0: { cellWidth: 40 }, 1: { cellWidth: 30 }, 2: { cellWidth: 20 }, 3: { cellWidth: 20 }, 4: { cellWidth: 20 }, 5: { cellWidth: 20 } },
                     head: [['Tytuł książki', 'Autor', 'Ilość', 'Cena netto', 'VAT', 'Cena brutto']],
-                    body: [
-                        [book.title, book.author, 1, `${netPrice.toFixed(2)} PLN`, `${vatAmount.toFixed(2)} PLN`, `${price.toFixed(2)} PLN`],
-                    ],
+                    body: invoiceItems.map((item) => {
+                        const netPrice = item.price / (1 + VAT_RATE);
+                        const vatAmount = item.price - netPrice;
+                        return [item.title, item.author, 1, `${netPrice.toFixed(2)} PLN`, `${vatAmount.toFixed(2)} PLN`, `${item.price.toFixed(2)} PLN`];
+                    }),
                 });
 
                 const finalY = doc.lastAutoTable.finalY + 10;
@@ -1,7 +1,9 @@
-import React, { useState } from 'react';
-import { Box, TextField, Button, IconButton, Collapse, FormGroup, FormControlLabel, Checkbox, Paper, Select, FormControl, InputLabel, Typography, MenuItem } from '@mui/material';
+import React, { useRef, useState } from 'react';
+import { useNavigate } from 'react-router-dom';
+import { Autocomplete, Box, TextField, Button, IconButton, Collapse, FormGroup, FormControlLabel, Checkbox, Paper, Select, FormControl, InputLabel, Typography, MenuItem } from '@mui/material';
 import SortIcon from '@mui/icons-material/Sort';
 import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
+import BooksService from '../service/BooksService';
 
 const SearchBooks = ({ onSearch, onSortFieldChange, onSortOrderChange, sortField, sortOrder }) => {
   const [searchTerm, setSearchTerm] = useState('');
@@ -11,6 +13,30 @@ const SearchBooks = ({ onSearch, onSortFieldChange, onSortOrderChange, sortField
   const [isbn, setIsbn] = useState('');
   const [isAvailable, setIsAvailable] = useState(false);
   const [advancedSearch, setAdvancedSearch] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const latestQuery = useRef('');
+  const navigate = useNavigate();
+
+  const handleSearchTermChange = (event, value) => {
+    setSearchTerm(value);
+    latestQuery.current = value;
+    if (!value.trim()) {
+      setSuggestions([]);
+      return;
+    }
+
+    BooksService.suggestBooks(value).then(response => {
+      if (latestQuery.current === value) {
+        setSuggestions(response.data);
+      }
+    }).catch(() => setSuggestions([]));
+  };
+
+  const handleSuggestionSelect = (event, value) => {
+    if (value && typeof value !== 'string') {
+      navigate(`/books/${value.id}`);
+    }
+  };
 
   const handleSearch = () => {
     onSearch({ searchTerm, author, priceFrom, priceTo, isbn, isAvailable });
@@ -26,12 +52,27 @@ const SearchBooks = ({ onSearch, onSortFieldChange, onSortOrderChange, sortField
     <Paper style={{ padding: '20px', margin: '20px 0' }}>
       <Box display="flex" justifyContent="space-between" alignItems="center" marginBottom="10px">
         <Box flex={1} marginRight="10px">
-          <TextField
-            fullWidth
-            label="Szukaj książek"
-            variant="outlined"
-            value={searchTerm}
-            onChange={(e) => setSearchTerm(e.target.value)}
+          <Autocomplete
+            freeSolo
+            options={suggestions}
+            filterOptions={(options) => options}
+            getOptionLabel={(option) => typeof option === 'string' ? option : option.title}
+            renderOption={(props, option) => (
+              <li {...props} key={option.id}>
+                {option.title} – {option.author}
+              </li>
+            )}
+            inputValue={searchTerm}
+            onInputChange={handleSearchTermChange}
+            onChange={handleSuggestionSelect}
+            renderInput={(params) => (
+              <TextField
+                {...params}
+                fullWidth
+                label="Szukaj książek"
+                variant="outlined"
+              />
+            )}
           />
         </Box>
         <Button variant="contained" onClick={handleSearch}>
@@ -5,6 +5,10 @@ class BooksService {
     return axios.get(`/books?${queryParams}`);
   }
 
+  suggestBooks(query) {
+    return axios.get('/books/suggest', { params: { query } });
+  }
+
   getBookById(id) {
     return axios.get(`/books/${id}`);
   }
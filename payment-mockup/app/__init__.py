@@ -6,6 +6,26 @@ from flask_cors import CORS
 
 PUBLIC_HOSTNAME = os.environ.get('PUBLIC_HOSTNAME', 'localhost:8080')
 PAYMENT_SERVICE_SECRET = os.environ.get('PAYMENT_SERVICE_SECRET', '09acfc5f3afe754c536a82f3ad8bbfd4')
+PAYMENT_TTL = int(os.environ.get('PAYMENT_TTL', '600'))
+PAYMENT_EXPIRY_INTERVAL = int(os.environ.get('PAYMENT_EXPIRY_INTERVAL', '15'))
+PAYMENT_EXPIRY_BATCH_SIZE = int(os.environ.get('PAYMENT_EXPIRY_BATCH_SIZE', '500'))
+PAYMENT_SCHEDULER_ENABLED = os.environ.get('PAYMENT_SCHEDULER_ENABLED', '1') == '1'
+OUTBOX_INTERVAL = float(os.environ.get('OUTBOX_INTERVAL', '2'))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_MAX_MESSAGES = int(os.environ.get('OUTBOX_MAX_MESSAGES', '50'))
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '4'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+OUTBOX_RETRY_BACKOFF = float(os.environ.get('OUTBOX_RETRY_BACKOFF', '2'))
+OUTBOX_LEASE = int(os.environ.get('OUTBOX_LEASE', '60'))
+CALLBACK_POOL_SIZE = int(os.environ.get('CALLBACK_POOL_SIZE', '10'))
+CALLBACK_CONNECT_TIMEOUT = float(os.environ.get('CALLBACK_CONNECT_TIMEOUT', '3'))
+CALLBACK_READ_TIMEOUT = float(os.environ.get('CALLBACK_READ_TIMEOUT', '10'))
+CALLBACK_MAX_RETRIES = int(os.environ.get('CALLBACK_MAX_RETRIES', '2'))
+CALLBACK_RETRY_BACKOFF = float(os.environ.get('CALLBACK_RETRY_BACKOFF', '0.2'))
+CALLBACK_BREAKER_THRESHOLD = int(os.environ.get('CALLBACK_BREAKER_THRESHOLD', '5'))
+CALLBACK_BREAKER_RESET = float(os.environ.get('CALLBACK_BREAKER_RESET', '30'))
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', '0.5'))
+SLOW_REQUEST_STATEMENTS = int(os.environ.get('SLOW_REQUEST_STATEMENTS', '5'))
 
 db = SQLAlchemy()
 
@@ -20,4 +40,13 @@ def create_app():
     from .routes import main
     app.register_blueprint(main)
 
+    from .instrumentation import instrument_app
+    instrument_app(app)
+
+    if PAYMENT_SCHEDULER_ENABLED:
+        from .scheduler import start_expiry_scheduler
+        from .outbox import start_outbox_worker
+        start_expiry_scheduler(app)
+        start_outbox_worker(app)
+
     return app
@@ -0,0 +1,18 @@
+import hmac
+import hashlib
+
+from . import PAYMENT_SERVICE_SECRET
+from .http_client import callback_client
+from .utils import generate_short_numerical_id
+from .edifact import encode_payment_statuses
+
+def build_status_message(statuses):
+    return encode_payment_statuses(generate_short_numerical_id(statuses[0][0]), statuses)
+
+def sign_message(edifact_str):
+    return hmac.new(PAYMENT_SERVICE_SECRET.encode(), edifact_str.encode(), hashlib.sha256).hexdigest()
+
+def send_status_callback(callback_url, statuses):
+    edifact_str = build_status_message(statuses)
+
+    return callback_client.post(callback_url, data=edifact_str, headers={"Content-Type": "text/plain", "X-Signature": sign_message(edifact_str)}, idempotent=True)
@@ -0,0 +1,177 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from pydifact.segmentcollection import Interchange
+
+BorrowingRequest = namedtuple('BorrowingRequest', ('user_id', 'lines', 'callback_url'))
+BorrowingLine = namedtuple('BorrowingLine', ('book_id', 'title', 'amount'))
+PaymentInitiated = namedtuple('PaymentInitiated', ('payment_id', 'title', 'amount'))
+PaymentStatus = namedtuple('PaymentStatus', ('payment_id', 'status'))
+
+SERVICE_TAGS = ('UNA', 'UNB', 'UNG', 'UNH', 'UNT', 'UNE', 'UNZ')
+
+RELEASED_CHARACTERS = {'?': '\x10', '+': '\x11', ':': '\x12', "'": '\x13'}
+UNESCAPE_TABLE = str.maketrans({placeholder: character for character, placeholder in RELEASED_CHARACTERS.items()})
+RELEASE_PATTERN = re.compile(r'\?(.)', re.S)
+
+UNB_TEMPLATE = "UNB+UNOC:3+{sender}+{recipient}+{interchange_time}+{reference}'"
+UNZ_TEMPLATE = "UNZ+{count}+{reference}'"
+STATUS_HEADER_TEMPLATE = "BGM+353:Payment Status'DTM+137:{date}:102'"
+BORROWING_LINE_TEMPLATE = "NAD+SU:{book_id}'FTX+AAI:Book Title:{title}'MOA+ZZZ:Amount:{amount}'".format
+
+def escape(value):
+    value = str(value)
+    if '?' in value:
+        value = value.replace('?', '??')
+    if '+' in value:
+        value = value.replace('+', '?+')
+    if ':' in value:
+        value = value.replace(':', '?:')
+    if "'" in value:
+        value = value.replace("'", "?'")
+    return value
+
+def envelope_fields(reference, timestamp):
+    # strftime dominates the cost of a small message, so the dates are formatted by hand.
+    timestamp = timestamp or datetime.utcnow()
+    return {
+        'reference': escape(reference),
+        'interchange_time': '%02d%02d%02d:%02d%02d' % (timestamp.year % 100, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute),
+        'date': '%04d%02d%02d' % (timestamp.year, timestamp.month, timestamp.day)
+    }
+
+def compile_template(sender, recipient, body):
+    header = UNB_TEMPLATE.replace('{sender}', escape(sender)).replace('{recipient}', escape(recipient))
+    return (header + body + UNZ_TEMPLATE).format
+
+encode_borrowing_message = compile_template('BiblioConnectAPI', 'PaymentMock', (
+    "BGM+351:Borrowing'"
+    "DTM+137:{date}:102'"
+    "NAD+BY:{user_id}'"
+    "{lines}"
+    "COM+Callback URL:{callback_url}'"
+))
+encode_initiated_message = compile_template('PaymentMock', 'Service', "FTX+AAI::{title}'MOA+ZZZ::{amount}'PID+::{payment_id}'UNT+4:1'")
+encode_status_query_message = compile_template('BiblioConnectAPI', 'PaymentMock', '{segments}')
+encode_status_message = compile_template('PaymentMock', 'Service', STATUS_HEADER_TEMPLATE + '{segments}')
+
+def encode_borrowing_request(reference, borrowing_request, timestamp=None):
+    return encode_borrowing_message(
+        **envelope_fields(reference, timestamp),
+        user_id=escape(borrowing_request.user_id),
+        lines=''.join(
+            BORROWING_LINE_TEMPLATE(book_id=escape(line.book_id), title=escape(line.title), amount=escape(line.amount))
+            for line in borrowing_request.lines
+        ),
+        callback_url=escape(borrowing_request.callback_url),
+        count=4 + 3 * len(borrowing_request.lines)
+    )
+
+def encode_payment_initiated(reference, payment_initiated, timestamp=None):
+    return encode_initiated_message(
+        **envelope_fields(reference, timestamp),
+        title=escape(payment_initiated.title),
+        amount=escape(payment_initiated.amount),
+        payment_id=escape(payment_initiated.payment_id),
+        count=4
+    )
+
+def encode_status_query(reference, payment_ids, timestamp=None):
+    return encode_status_query_message(
+        **envelope_fields(reference, timestamp),
+        segments=''.join(f"PID+{escape(payment_id)}'" for payment_id in payment_ids),
+        count=len(payment_ids)
+    )
+
+def encode_payment_statuses(reference, statuses, timestamp=None):
+    return encode_status_message(
+        **envelope_fields(reference, timestamp),
+        segments=''.join(f"STS+{escape(status)}'PID+::{escape(payment_id)}'" for payment_id, status in statuses),
+        count=2 + 2 * len(statuses)
+    )
+
+def split_components(element, escaped):
+    components = element.split(':')
+    if escaped:
+        components = [component.translate(UNESCAPE_TABLE) for component in components]
+    return components
+
+def fast_segments(message):
+    escaped = '?' in message
+    if escaped:
+        message = RELEASE_PATTERN.sub(lambda match: RELEASED_CHARACTERS.get(match.group(1), match.group(1)), message)
+
+    for raw_segment in message.split("'"):
+        raw_segment = raw_segment.strip('\r\n')
+        if not raw_segment:
+            continue
+        elements = raw_segment.split('+')
+        yield elements[0], [split_components(element, escaped) for element in elements[1:]]
+
+def pydifact_segments(message):
+    for segment in Interchange.from_str(message).segments:
+        yield segment.tag, [element if isinstance(element, list) else [element] for element in segment.elements]
+
+def iter_segments(message):
+    # Custom separators announced in a UNA header are rare enough to leave to pydifact.
+    segments = pydifact_segments(message) if message.lstrip().startswith('UNA') else fast_segments(message)
+    for tag, elements in segments:
+        if tag not in SERVICE_TAGS:
+            yield tag, elements
+
+def component(elements, element_index, component_index):
+    try:
+        return elements[element_index][component_index]
+    except IndexError:
+        return None
+
+def decode_borrowing_request(message):
+    user_id, callback_url = None, None
+    lines = []
+    for tag, elements in iter_segments(message):
+        qualifier = component(elements, 0, 0)
+        if tag == 'NAD' and qualifier == 'BY':
+            user_id = component(elements, 0, 1)
+        elif tag == 'NAD' and qualifier == 'SU':
+            lines.append({'book_id': component(elements, 0, 1)})
+        elif tag == 'FTX' and qualifier == 'AAI':
+            if not lines or 'title' in lines[-1]:
+                lines.append({})
+            lines[-1]['title'] = component(elements, 0, 2)
+        elif tag == 'MOA' and qualifier == 'ZZZ':
+            if not lines or 'amount' in lines[-1]:
+                lines.append({})
+            lines[-1]['amount'] = component(elements, 0, 2)
+        elif tag == 'COM' and qualifier == 'Callback URL':
+            callback_url = component(elements, 0, 1)
+
+    lines = [BorrowingLine(line.get('book_id'), line.get('title'), line.get('amount')) for line in lines]
+    return BorrowingRequest(user_id, lines, callback_url)
+
+def decode_payment_initiated(message):
+    values = {}
+    for tag, elements in iter_segments(message):
+        if tag == 'PID':
+            values['payment_id'] = elements[0][-1] if elements else None
+        elif tag == 'FTX' and component(elements, 0, 0) == 'AAI':
+            values['title'] = component(elements, 0, 2)
+        elif tag == 'MOA' and component(elements, 0, 0) == 'ZZZ':
+            values['amount'] = component(elements, 0, 2)
+
+    return PaymentInitiated(**{field: values.get(field) for field in PaymentInitiated._fields})
+
+def decode_status_query(message):
+    return [elements[0][-1] for tag, elements in iter_segments(message) if tag == 'PID' and elements and elements[0][-1]]
+
+def decode_payment_statuses(message):
+    statuses = {}
+    status = None
+    for tag, elements in iter_segments(message):
+        if tag == 'STS':
+            status = component(elements, 0, 0)
+        elif tag == 'PID' and status and elements:
+            statuses[elements[0][-1]] = status
+            status = None
+
+    return statuses
@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .metrics import registry
+from .instrumentation import record_outbound_call
+from . import CALLBACK_POOL_SIZE, CALLBACK_CONNECT_TIMEOUT, CALLBACK_READ_TIMEOUT, CALLBACK_MAX_RETRIES, CALLBACK_RETRY_BACKOFF, CALLBACK_BREAKER_THRESHOLD, CALLBACK_BREAKER_RESET
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single probe through; its outcome decides whether the circuit closes again.
+                self.state = self.HALF_OPEN
+                return True
+
+            return False
+
+    def is_open(self):
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+def is_safe_to_retry(error, method, idempotent):
+    if idempotent or method in IDEMPOTENT_METHODS:
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    # The request never reached the server, so even a non-idempotent call can be repeated.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    return isinstance(error, requests.ConnectionError) and isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+
+class HttpClient:
+    def __init__(self, name, pool_size, connect_timeout, read_timeout, max_retries, retry_backoff, breaker_threshold, breaker_reset):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self.requests_total = registry.counter(f'{name}_client_requests_total', f'Outbound {name} requests by outcome.', ('host', 'outcome'))
+        self.request_duration = registry.histogram(f'{name}_client_request_duration_seconds', f'Latency of outbound {name} requests by status.', ('host', 'method', 'status'))
+        registry.gauge(f'{name}_client_pool_connections_created', f'Connections opened by the {name} client pool since start.', self.pool_connections_created, ('host',))
+        registry.gauge(f'{name}_client_pool_idle_connections', f'Idle keep-alive connections in the {name} client pool.', self.pool_idle_connections, ('host',))
+        registry.gauge(f'{name}_client_breaker_open', f'1 when the {name} circuit breaker rejects requests, 0.5 when half open.', self.breaker_states, ('host',))
+        registry.gauge(f'{name}_client_breaker_trips', f'Number of times the {name} circuit breaker opened.', self.breaker_trips, ('host',))
+
+    def breaker(self, host):
+        with self.breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return self.breakers[host]
+
+    def is_available(self, url):
+        return not self.breaker(urlsplit(url).netloc).is_open()
+
+    def request(self, method, url, idempotent=False, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+
+        if not breaker.allow_request():
+            self.requests_total.inc(host=host, outcome='rejected')
+            raise CircuitOpenError(f'Circuit breaker for {host} is open')
+
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            started_at = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as error:
+                self.observe_call(started_at, host, method, 'error')
+                if attempt < self.max_retries and is_safe_to_retry(error, method, idempotent):
+                    self.requests_total.inc(host=host, outcome='retried')
+                    attempt += 1
+                    self.sleep_before_retry(attempt)
+                    continue
+
+                self.requests_total.inc(host=host, outcome='error')
+                breaker.record_failure()
+                raise
+
+            self.observe_call(started_at, host, method, response.status_code)
+            if response.status_code >= 500:
+                if attempt < self.max_retries and (idempotent or method in IDEMPOTENT_METHODS):
+                    self.requests_total.inc(host=host, outcome='retried')
+                    attempt += 1
+                    self.sleep_before_retry(attempt)
+                    continue
+
+                self.requests_total.inc(host=host, outcome='server_error')
+                breaker.record_failure()
+                return response
+
+            self.requests_total.inc(host=host, outcome='ok')
+            breaker.record_success()
+            return response
+
+    def observe_call(self, started_at, host, method, status):
+        elapsed = time.perf_counter() - started_at
+        self.request_duration.observe(elapsed, host=host, method=method, status=status)
+        record_outbound_call(elapsed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def sleep_before_retry(self, attempt):
+        delay = self.retry_backoff * (2 ** (attempt - 1))
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def connection_pools(self):
+        pools = self.adapter.poolmanager.pools
+        connection_pools = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connection_pools[f'{key.key_host}:{key.key_port}'] = pool
+        return connection_pools
+
+    def pool_connections_created(self):
+        return {host: pool.num_connections for host, pool in self.connection_pools().items()}
+
+    def pool_idle_connections(self):
+        # Unused pool slots are kept as None placeholders in the queue.
+        return {host: sum(1 for connection in list(pool.pool.queue) if connection) if pool.pool else 0 for host, pool in self.connection_pools().items()}
+
+    def breaker_states(self):
+        values = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 0.5, CircuitBreaker.OPEN: 1}
+        return {host: values[breaker.state] for host, breaker in list(self.breakers.items())}
+
+    def breaker_trips(self):
+        return {host: breaker.times_opened for host, breaker in list(self.breakers.items())}
+
+callback_client = HttpClient(
+    'callback',
+    pool_size=CALLBACK_POOL_SIZE,
+    connect_timeout=CALLBACK_CONNECT_TIMEOUT,
+    read_timeout=CALLBACK_READ_TIMEOUT,
+    max_retries=CALLBACK_MAX_RETRIES,
+    retry_backoff=CALLBACK_RETRY_BACKOFF,
+    breaker_threshold=CALLBACK_BREAKER_THRESHOLD,
+    breaker_reset=CALLBACK_BREAKER_RESET
+)
@@ -0,0 +1,106 @@
+import threading
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+    return '{' + pairs + '}'
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+class Histogram:
+    type = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self.lock:
+            counts, total, count = self.values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(bucket_count + 1 if value <= bound else bucket_count for bucket_count, bound in zip(counts, self.buckets))
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for key, (counts, total, count) in values:
+            labels = tuple(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', labels + (('le', bound),), bucket_count
+            yield f'{self.name}_bucket', labels + (('le', '+Inf'),), count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name, description, function, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if not self.labelnames:
+            yield self.name, (), value
+            return
+
+        for key, label_value in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, tuple(zip(self.labelnames, key)), label_value
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labelnames=()):
+        return self.register(Counter(name, description, labelnames))
+
+    def histogram(self, name, description, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self.register(Histogram(name, description, labelnames, buckets))
+
+    def gauge(self, name, description, function, labelnames=()):
+        return self.register(Gauge(name, description, function, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
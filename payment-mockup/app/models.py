@@ -6,3 +6,20 @@ class Payment(db.Model):
     amount = db.Column(db.Float, nullable=False)
     title = db.Column(db.String(255), nullable=False)
     callback_url = db.Column(db.String(255), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+class CallbackOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.String, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    callback_url = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    failed = db.Column(db.Boolean, nullable=False, default=False)
+    last_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_callback_outbox_due', 'delivered_at', 'failed', 'next_attempt_at'),
+    )
@@ -0,0 +1,146 @@
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import func
+
+from . import db, OUTBOX_INTERVAL, OUTBOX_BATCH_SIZE, OUTBOX_MAX_MESSAGES, OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BACKOFF, OUTBOX_LEASE
+from .models import CallbackOutbox
+from .callbacks import send_status_callback
+from .metrics import registry
+
+_worker_started = False
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+deliveries_total = registry.counter('callback_outbox_deliveries_total', 'Outbox callback messages by delivery outcome.', ('outcome',))
+delivery_latency = registry.histogram(
+    'callback_outbox_delivery_latency_seconds',
+    'Time from a status change to the successful delivery of its callback.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+)
+
+def outbox_depth():
+    return db.session.query(func.count(CallbackOutbox.id)) \
+        .filter(CallbackOutbox.delivered_at == None, CallbackOutbox.failed == False) \
+        .scalar()
+
+registry.gauge('callback_outbox_depth', 'Callback messages waiting for delivery.', outbox_depth)
+
+def enqueue_status_callback(payment_id, status, callback_url):
+    now = datetime.utcnow()
+    db.session.add(CallbackOutbox(
+        payment_id=payment_id,
+        status=status,
+        callback_url=callback_url,
+        created_at=now,
+        next_attempt_at=now,
+        attempts=0
+    ))
+
+def notify_outbox():
+    _wakeup.set()
+
+def claim_due_messages():
+    now = datetime.utcnow()
+    messages = CallbackOutbox.query \
+        .filter(CallbackOutbox.delivered_at == None, CallbackOutbox.failed == False, CallbackOutbox.next_attempt_at <= now) \
+        .order_by(CallbackOutbox.next_attempt_at) \
+        .limit(OUTBOX_BATCH_SIZE) \
+        .with_for_update(skip_locked=True) \
+        .all()
+
+    # Push the next attempt past the lease so other workers skip these rows while they are in flight.
+    claimed = []
+    for message in messages:
+        message.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE)
+        claimed.append((message.id, message.callback_url, message.payment_id, message.status))
+    db.session.commit()
+
+    return claimed
+
+def group_by_callback_url(claimed):
+    batches = OrderedDict()
+    for message_id, callback_url, payment_id, status in claimed:
+        batches.setdefault(callback_url, []).append((message_id, payment_id, status))
+
+    for callback_url, url_messages in batches.items():
+        for index in range(0, len(url_messages), OUTBOX_MAX_MESSAGES):
+            yield callback_url, url_messages[index:index + OUTBOX_MAX_MESSAGES]
+
+def deliver_batch(batch):
+    callback_url, batch_messages = batch
+    statuses = [(payment_id, status) for _, payment_id, status in batch_messages]
+    try:
+        response = send_status_callback(callback_url, statuses)
+    except requests.RequestException as error:
+        return None, str(error)
+
+    if response.status_code >= 500:
+        return None, f'HTTP {response.status_code}'
+    return response.status_code, None
+
+def deliver_due_callbacks(executor):
+    claimed = claim_due_messages()
+    if not claimed:
+        return 0
+
+    batches = list(group_by_callback_url(claimed))
+    results = {}
+    for (callback_url, batch_messages), result in zip(batches, executor.map(deliver_batch, batches)):
+        for message_id, _, _ in batch_messages:
+            results[message_id] = result
+
+    now = datetime.utcnow()
+    for message in CallbackOutbox.query.filter(CallbackOutbox.id.in_(results)).all():
+        status_code, error = results[message.id]
+        message.attempts += 1
+        if status_code is not None and status_code < 400:
+            message.delivered_at = now
+            deliveries_total.inc(outcome='delivered')
+            delivery_latency.observe((now - message.created_at).total_seconds())
+        elif status_code is not None:
+            message.failed = True
+            message.last_error = f'HTTP {status_code}'
+            deliveries_total.inc(outcome='rejected')
+        elif message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            message.failed = True
+            message.last_error = error
+            deliveries_total.inc(outcome='failed')
+        else:
+            delay = OUTBOX_RETRY_BACKOFF * (2 ** (message.attempts - 1))
+            message.next_attempt_at = now + timedelta(seconds=delay * random.uniform(0.5, 1.5))
+            message.last_error = error
+            deliveries_total.inc(outcome='retried')
+    db.session.commit()
+
+    return len(claimed)
+
+def run_outbox_worker(app):
+    with app.app_context(), ThreadPoolExecutor(max_workers=OUTBOX_WORKERS) as executor:
+        while True:
+            _wakeup.clear()
+            delivered = 0
+            try:
+                delivered = deliver_due_callbacks(executor)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Callback outbox delivery failed')
+            finally:
+                db.session.remove()
+
+            if delivered < OUTBOX_BATCH_SIZE:
+                _wakeup.wait(OUTBOX_INTERVAL)
+
+def start_outbox_worker(app):
+    global _worker_started
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+
+    thread = threading.Thread(target=run_outbox_worker, args=(app,), name='callback-outbox', daemon=True)
+    thread.start()
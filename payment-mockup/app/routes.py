@@ -1,64 +1,60 @@
-from datetime import datetime
-import json
-import sys
-from threading import Timer
-from flask import Blueprint, Response, request, jsonify, render_template, url_for, redirect, current_app
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, render_template, url_for, redirect
+from sqlalchemy import update
 from . import db
 from .models import Payment
-from app import PUBLIC_HOSTNAME, PAYMENT_SERVICE_SECRET
+from .outbox import enqueue_status_callback, notify_outbox
+from .utils import generate_short_numerical_id
+from .metrics import registry
+from .edifact import PaymentInitiated, PaymentStatus, encode_payment_initiated, encode_payment_statuses, decode_borrowing_request, decode_status_query
+from app import PUBLIC_HOSTNAME, PAYMENT_SERVICE_SECRET, PAYMENT_TTL
 import hmac
 import hashlib
 
 import uuid
-import requests
-from pydifact.segments import Segment
-from pydifact.segmentcollection import Interchange
 
 main = Blueprint('main', __name__)
 
+BULK_STATUS_LIMIT = 1000
+PAYMENT_TITLE_LENGTH = 255
+
 @main.route('/initiate_payment', methods=['POST'])
 def initiate_payment():
     edifact_message = request.data.decode('utf-8')
 
-    segments = Interchange.from_str(edifact_message).segments
+    borrowing_request = decode_borrowing_request(edifact_message)
+    lines, callback_url = borrowing_request.lines, borrowing_request.callback_url
 
-    amount = None
-    callback_url = None
-    title = None
-    
-    for segment in segments:
-        if segment.tag == 'FTX' and segment.elements[0][0] == 'AAI':
-            title = segment.elements[0][2]
-        elif segment.tag == 'MOA' and segment.elements[0][0] == 'ZZZ':
-            amount = segment.elements[0][2]
-        elif segment.tag == 'COM' and segment.elements[0][0] == 'Callback URL':
-            callback_url = segment.elements[0][1]
-
-    if not title or not amount or not callback_url:
+    if not lines or not callback_url or not all(line.title and line.amount for line in lines):
         return jsonify({'message': 'Missing required information in EDIFACT message ' + edifact_message}), 400
+
+    try:
+        amount = round(sum(float(line.amount) for line in lines), 2)
+    except ValueError:
+        return jsonify({'message': 'Invalid amount in EDIFACT message ' + edifact_message}), 400
+
+    title = ', '.join(line.title for line in lines)
+    if len(title) > PAYMENT_TITLE_LENGTH:
+        title = title[:PAYMENT_TITLE_LENGTH - 3] + '...'
     
     new_payment = Payment(
         payment_id=str(uuid.uuid4()),
         status='pending',
         amount=amount, 
         title=title,
-        callback_url=callback_url 
+        callback_url=callback_url,
+        expires_at=datetime.utcnow() + timedelta(seconds=PAYMENT_TTL)
     )
     db.session.add(new_payment)
     db.session.commit()
 
     payment_url = "http://" + url_for('main.payment_page', payment_id=new_payment.payment_id, _external=True).replace(request.host_url, f'{PUBLIC_HOSTNAME}/')
-    app = current_app._get_current_object()
-    Timer(600, cancel_payment, args=[new_payment.payment_id, app]).start()
-
-    response_interchange = Interchange("PaymentMock", "Service", str(generate_short_numerical_id(new_payment.payment_id)), ("UNOC", 3))
 
-    response_interchange.add_segment(Segment("FTX", ["AAI", "", title]))
-    response_interchange.add_segment(Segment("MOA", ["ZZZ", "", amount]))
-    response_interchange.add_segment(Segment("PID", ["", "", new_payment.payment_id]))
-    response_interchange.add_segment(Segment("UNT", ["4", "1"]))
-
-    response_edifact = response_interchange.serialize()
+    response_edifact = encode_payment_initiated(generate_short_numerical_id(new_payment.payment_id), PaymentInitiated(
+        payment_id=new_payment.payment_id,
+        title=title,
+        amount=amount
+    ))
 
     return jsonify({'edi': response_edifact, 'payment_url': payment_url})
 
@@ -68,43 +64,32 @@ def payment_page(payment_id):
     
     return render_template('payment_page.html', payment_id=payment.payment_id, book_title=payment.title, amount=payment.amount, status=payment.status)
 
-def generate_short_numerical_id(payment_id):
-    datetime_now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    
-    combined_string = f"{payment_id}-{datetime_now}"
-
-    hash_object = hashlib.sha256(combined_string.encode())
-    hex_dig = hash_object.hexdigest()
-    
-    short_id = int(hex_dig[:8], 16)
-    
-    return short_id
-
 @main.route('/process_payment/<string:payment_id>', methods=['POST'])
 def process_payment(payment_id):
     action = request.form.get('action')
     payment = Payment.query.get_or_404(payment_id)
+    status = 'success' if action == 'pay' else 'canceled'
+
+    # Settling only a pending, unexpired row lets exactly one of concurrent submissions and the expiry scheduler win.
+    now = datetime.utcnow()
+    settled = db.session.execute(
+        update(Payment)
+        .where(Payment.payment_id == payment_id, Payment.status == 'pending', Payment.expires_at >= now)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
 
-    if action == 'pay':
-        payment.status = 'success'
-    else:
-        payment.status = 'canceled'
-    
-    db.session.commit()
+    if settled.rowcount != 1:
+        db.session.rollback()
+        if payment.expires_at is None or payment.expires_at < now:
+            return render_template('payment_result.html', status='canceled'), 410
+        return render_template('payment_result.html', status=payment.status), 409
 
     if payment.callback_url:
-        edifact_message = Interchange("PaymentMock", "Service", str(generate_short_numerical_id(payment_id)), ("UNOC", 3))
-        edifact_message.add_segment(Segment("BGM", ["353", "Payment Status"]))
-        edifact_message.add_segment(Segment("DTM", ["137", datetime.utcnow().strftime("%Y%m%d"), "102"]))
-        edifact_message.add_segment(Segment("STS", [payment.status]))
-        edifact_message.add_segment(Segment("PID", ["", "", payment.payment_id]))
+        enqueue_status_callback(payment.payment_id, status, payment.callback_url)
 
-        edifact_str = edifact_message.serialize()
-        
-        secret = PAYMENT_SERVICE_SECRET
-        signature = hmac.new(secret.encode(), edifact_str.encode(), hashlib.sha256).hexdigest()
-        
-        requests.post(payment.callback_url, data=edifact_str, headers={"Content-Type": "text/plain", "X-Signature": signature})
+    db.session.commit()
+    notify_outbox()
 
     return redirect(url_for('main.payment_result', payment_id=payment.payment_id))
 
@@ -114,41 +99,17 @@ def payment_result(payment_id):
     
     return render_template('payment_result.html', status=payment.status)
 
-def cancel_payment(payment_id, app):
-    with app.app_context():
-        payment = Payment.query.get(payment_id)
-        if payment and payment.status == 'pending':
-            payment.status = 'canceled'
-            db.session.commit()
-            if payment.callback_url:
-                payload = {'payment_id': payment_id, 'status': 'canceled'}
-                secret = PAYMENT_SERVICE_SECRET
-                signature = hmac.new(secret.encode(), json.dumps(payload).encode(), hashlib.sha256).hexdigest()
-                headers = {'X-Signature': signature}
-                requests.post(payment.callback_url, json=payload, headers=headers)
-                
 @main.route('/payment_status', methods=['GET'])
 def receive_edi():
     edifact_message = request.data.decode('utf-8')
-    segments = Interchange.from_str(edifact_message).segments
-
-    payment_id = None
-
-    for segment in segments:
-        if segment.tag == 'PID':
-            payment_id = segment.elements[0]
+    payment_ids = decode_status_query(edifact_message)
+    payment_id = payment_ids[-1] if payment_ids else None
 
     if payment_id:
         payment = Payment.query.get(payment_id)
         
-        edifact_message = Interchange("PaymentMock", "Service", str(generate_short_numerical_id(payment_id)), ("UNOC", 3))
-        edifact_message.add_segment(Segment("BGM", ["353", "Payment Status"]))
-        edifact_message.add_segment(Segment("DTM", ["137", datetime.utcnow().strftime("%Y%m%d"), "102"]))
-        edifact_message.add_segment(Segment("STS", [payment.status]))
-        edifact_message.add_segment(Segment("PID", ["", "", payment.payment_id]))
-
         secret = PAYMENT_SERVICE_SECRET
-        edifact_str = edifact_message.serialize()
+        edifact_str = encode_payment_statuses(generate_short_numerical_id(payment_id), [PaymentStatus(payment.payment_id, payment.status)])
         signature = hmac.new(secret.encode(), edifact_str.encode(), hashlib.sha256).hexdigest()
 
         resp = Response(edifact_str, 200)
@@ -156,4 +117,30 @@ def receive_edi():
         
         return resp
     else:
-        return '', 400
\ No newline at end of file
+        return '', 400
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/payment_status/bulk', methods=['POST'])
+def receive_bulk_edi():
+    edifact_message = request.data.decode('utf-8')
+    payment_ids = decode_status_query(edifact_message)
+
+    if not payment_ids:
+        return '', 400
+
+    if len(payment_ids) > BULK_STATUS_LIMIT:
+        return jsonify({'message': f'At most {BULK_STATUS_LIMIT} payments can be queried at once'}), 413
+
+    statuses = dict(db.session.query(Payment.payment_id, Payment.status).filter(Payment.payment_id.in_(payment_ids)).all())
+
+    secret = PAYMENT_SERVICE_SECRET
+    edifact_str = encode_payment_statuses(generate_short_numerical_id(payment_ids[0]), [PaymentStatus(payment_id, statuses.get(payment_id, 'unknown')) for payment_id in dict.fromkeys(payment_ids)])
+    signature = hmac.new(secret.encode(), edifact_str.encode(), hashlib.sha256).hexdigest()
+
+    resp = Response(edifact_str, 200)
+    resp.headers['X-Signature'] = signature
+
+    return resp
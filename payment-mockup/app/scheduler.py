@@ -0,0 +1,64 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from . import db, PAYMENT_EXPIRY_INTERVAL, PAYMENT_EXPIRY_BATCH_SIZE
+from .models import Payment
+from .outbox import enqueue_status_callback, notify_outbox
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+def expire_due_payments():
+    expired_total = 0
+    while True:
+        due_payments = select(Payment.payment_id) \
+            .where(Payment.status == 'pending', (Payment.expires_at < datetime.utcnow()) | (Payment.expires_at == None)) \
+            .limit(PAYMENT_EXPIRY_BATCH_SIZE)
+
+        expired = db.session.execute(
+            update(Payment)
+            .where(Payment.payment_id.in_(due_payments), Payment.status == 'pending')
+            .values(status='canceled')
+            .returning(Payment.payment_id, Payment.callback_url)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        for payment_id, callback_url in expired:
+            if callback_url:
+                enqueue_status_callback(payment_id, 'canceled', callback_url)
+        db.session.commit()
+
+        if expired:
+            notify_outbox()
+
+        expired_total += len(expired)
+        if len(expired) < PAYMENT_EXPIRY_BATCH_SIZE:
+            return expired_total
+
+def run_expiry_scheduler(app, interval):
+    with app.app_context():
+        while True:
+            try:
+                expired = expire_due_payments()
+                if expired:
+                    app.logger.info('Expired %s pending payments', expired)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Payment expiry run failed')
+            finally:
+                db.session.remove()
+
+            time.sleep(interval)
+
+def start_expiry_scheduler(app):
+    global _scheduler_started
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+
+    thread = threading.Thread(target=run_expiry_scheduler, args=(app, PAYMENT_EXPIRY_INTERVAL), name='payment-expiry', daemon=True)
+    thread.start()
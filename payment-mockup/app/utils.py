@@ -0,0 +1,15 @@
+import hashlib
+
+from datetime import datetime
+
+def generate_short_numerical_id(payment_id):
+    datetime_now = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    
+    combined_string = f"{payment_id}-{datetime_now}"
+
+    hash_object = hashlib.sha256(combined_string.encode())
+    hex_dig = hash_object.hexdigest()
+    
+    short_id = int(hex_dig[:8], 16)
+    
+    return short_id
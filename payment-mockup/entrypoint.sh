@@ -1,11 +1,11 @@
 #!/bin/bash
 
 if [ ! -d "migrations" ]; then
-    flask db init
+    PAYMENT_SCHEDULER_ENABLED=0 flask db init
 fi
 
-flask db migrate
+PAYMENT_SCHEDULER_ENABLED=0 flask db migrate
 
-flask db upgrade
+PAYMENT_SCHEDULER_ENABLED=0 flask db upgrade
 
 exec "$@"
\ No newline at end of file